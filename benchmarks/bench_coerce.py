@@ -0,0 +1,59 @@
+
+import argparse
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.generate import _dates
+from src.utils.coerce import to_currency, to_date_key, to_timestamp
+
+# Micro-benchmark of the coercion layer against the idioms the transforms used before.
+# Usage: python -m benchmarks.bench_coerce --rows 1000000
+
+
+def old_currency(series):
+    return series.replace(r'[\$,\-]', '', regex=True).astype(float)
+
+
+def old_date_key(series):
+    return pd.to_datetime(series, errors='coerce').dt.strftime('%Y%m%d').astype(int)
+
+
+def old_timestamp(series):
+    return pd.to_datetime(series, errors='coerce')
+
+
+def cases(rows: int, rng):
+    prices = pd.Series(rng.integers(10, 500, rows) * 1000).map(lambda value: f"${value:,.2f}")
+    timestamps = pd.Series(_dates(rng, rows))
+    return [
+        ("currency -> float", prices, old_currency, to_currency),
+        ("timestamp -> date key", timestamps, old_date_key, to_date_key),
+        ("date -> date key", pd.Series(timestamps.dt.date), old_date_key, to_date_key),
+        ("timestamp text -> timestamp", timestamps.dt.strftime("%Y-%m-%d %H:%M:%S"), old_timestamp, to_timestamp),
+    ]
+
+
+def best(func, series, repeat):
+    return min(timeit.repeat(lambda: func(series.copy()), number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coercion layer micro-benchmark")
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'rows':>10} {'case':<30} {'old s':>9} {'new s':>9} {'speedup':>8}")
+    for rows in args.rows:
+        for name, series, old, new in cases(rows, rng):
+            # both idioms must give the same values on valid input
+            pd.testing.assert_series_equal(old(series), new(series), check_dtype=False, check_names=False)
+            before, after = best(old, series, args.repeat), best(new, series, args.repeat)
+            print(f"{rows:>10} {name:<30} {before:>9.4f} {after:>9.4f} {before / after:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
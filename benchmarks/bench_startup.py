@@ -0,0 +1,75 @@
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Startup benchmark of the pipeline command line: wall time of `python data_pipeline.py --help` (imports and
+# argument parsing, no database), the slowest imports and whether the optional clients were imported at startup.
+# Usage: python -m benchmarks.bench_startup --repeat 5 --output bench_startup.json
+
+ROOT = Path(__file__).parent.parent
+# imported only by the stages that need them (spreadsheet extraction, pangres upsert, minio quarantine,
+# the data frames and databases, the warehouse transforms)
+LAZY_MODULES = ["gspread", "oauth2client", "pangres", "minio", "pandas", "numpy", "pyarrow", "sqlalchemy",
+                "src.integration.warehouse.transform"]
+
+
+def startup_time(repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "data_pipeline.py", "--help"], cwd=ROOT, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def import_times(top: int):
+    # cumulative import time (microseconds) of each module, from python -X importtime
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import data_pipeline"], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stderr
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us)
+    # top level packages only, their submodules are included in the cumulative time
+    packages = {name: us for name, us in modules.items() if "." not in name or name.startswith("src.")}
+    return dict(sorted(packages.items(), key=lambda item: -item[1])[:top])
+
+
+def eager_modules():
+    # optional clients that were imported with data_pipeline although no stage ran
+    code = f"import sys, data_pipeline; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return [name for name in output.strip().split(",") if name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline command line startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to report")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    report = {
+        "startup_s": round(startup_time(args.repeat), 4),
+        "imports_ms": {name: round(us / 1000, 1) for name, us in import_times(args.top).items()},
+        "eager_modules": eager_modules(),
+    }
+    print(f"startup (data_pipeline.py --help, best of {args.repeat}): {report['startup_s']:.3f}s")
+    for name, ms in report["imports_ms"].items():
+        print(f"{ms:>10.1f} ms  {name}")
+    print("imported at startup: " + (", ".join(report["eager_modules"]) or "none of " + ", ".join(LAZY_MODULES)))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+
+import argparse
+import json
+
+# Compare two benchmark reports (e.g. from two commits) stage by stage.
+# Usage: python -m benchmarks.compare old.json new.json
+
+
+def index(report: dict):
+    return {(run["scale"], stage["stage"], stage["table"]): stage for run in report["runs"] for stage in run["stages"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    old, new = index(baseline), index(candidate)
+    print(f"baseline {baseline.get('commit')} vs candidate {candidate.get('commit')}")
+    print(f"{'scale':>10} {'stage':>30} {'table':<20} {'old s':>9} {'new s':>9} {'speedup':>8} {'old MB':>8} {'new MB':>8}")
+    for key in old:
+        if key not in new:
+            continue
+        scale, stage, table_name = key
+        before, after = old[key], new[key]
+        speedup = before["wall_s"] / after["wall_s"] if after["wall_s"] else float("inf")
+        print(f"{scale:>10} {stage:>30} {table_name:<20} {before['wall_s']:>9.3f} {after['wall_s']:>9.3f} {speedup:>7.2f}x "
+              f"{before['peak_rss_mb']:>8.0f} {after['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
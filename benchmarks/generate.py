@@ -0,0 +1,149 @@
+
+import numpy as np
+import pandas as pd
+
+# Synthetic source data for the benchmark. Sizes scale from the number of orders,
+# every table is produced in chunks so large scale factors don't need the whole table in memory.
+
+STORES = ["Paccafe Sudirman", "Paccafe Kemang", "Paccafe Depok", "Paccafe Bandung", "Paccafe Bekasi",
+          "Paccafe Bogor", "Paccafe Tangerang", "Paccafe Surabaya", "Paccafe Malang", "Paccafe Yogyakarta"]
+ROLES = ["barista", "cashier", "manager", "supervisor", "cleaner"]
+CATEGORIES = ["coffee", "tea", "pastry", "snack", "merchandise", "beans"]
+PAYMENTS = ["cash", "credit card", "debit card", "e-wallet"]
+STATUSES = ["completed", "pending", "cancelled", "refunded"]
+REASONS = ["restock", "sale", "damaged", "expired", "adjustment"]
+
+
+def table_sizes(orders: int) -> dict:
+    return {
+        "customers": max(100, orders // 10),
+        "employees": max(20, orders // 1000),
+        "products": max(50, orders // 200),
+        "orders": orders,
+        "order_details": orders * 3,
+        "inventory_tracking": max(100, orders // 2),
+    }
+
+
+def _ids(start: int, stop: int):
+    return np.arange(start + 1, stop + 1)
+
+
+def _dates(rng, size: int, start: str = "2022-01-01", days: int = 1000):
+    return pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, days * 24 * 3600, size), unit="s")
+
+
+def customers(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    phone = pd.Series("08" + pd.Series(rng.integers(10**9, 10**10, len(ids))).astype(str))
+    # ~2% missing phones and ~1% negative loyalty points for the validation rules
+    phone[rng.random(len(ids)) < 0.02] = None
+    points = rng.integers(0, 5000, len(ids))
+    points[rng.random(len(ids)) < 0.01] *= -1
+    return pd.DataFrame({
+        "customer_id": ids,
+        "first_name": "first" + pd.Series(ids).astype(str),
+        "last_name": "last" + pd.Series(ids).astype(str),
+        "email": "customer" + pd.Series(ids).astype(str) + "@mail.com",
+        "phone": phone,
+        "loyalty_points": points,
+    })
+
+
+def employees(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    return pd.DataFrame({
+        "employee_id": ids,
+        "first_name": "first" + pd.Series(ids).astype(str),
+        "last_name": "last" + pd.Series(ids).astype(str),
+        "hire_date": _dates(rng, len(ids), "2015-01-01", 3000).date,
+        "role": rng.choice(ROLES, len(ids)),
+        "email": "employee" + pd.Series(ids).astype(str) + "@paccafe.com",
+    })
+
+
+def products(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    unit_price = rng.integers(10, 500, len(ids)) * 1000
+    cost_price = (unit_price * rng.uniform(0.3, 0.8, len(ids))).round(-2)
+    return pd.DataFrame({
+        "product_id": ids,
+        "product_name": "product" + pd.Series(ids).astype(str),
+        "category": rng.choice(CATEGORIES, len(ids)),
+        # prices come as currency text, like the real source
+        "unit_price": pd.Series(unit_price).map(lambda value: f"${value:,.2f}"),
+        "cost_price": pd.Series(cost_price).map(lambda value: f"${value:,.2f}"),
+        "in_stock": rng.random(len(ids)) < 0.9,
+        "store_branch": rng.choice(STORES, len(ids)),
+    })
+
+
+def orders(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    customer_id = rng.integers(1, sizes["customers"] + 1, len(ids)).astype(float)
+    customer_id[rng.random(len(ids)) < 0.01] = np.nan
+    return pd.DataFrame({
+        "order_id": ids,
+        "customer_id": pd.array(customer_id, dtype="Int64"),
+        "employee_id": rng.integers(1, sizes["employees"] + 1, len(ids)),
+        "order_date": _dates(rng, len(ids)),
+        "total_amount": (rng.integers(10, 2000, len(ids)) * 1000).astype(float),
+        "payment_method": rng.choice(PAYMENTS, len(ids)),
+        "order_status": rng.choice(STATUSES, len(ids)),
+    })
+
+
+def order_details(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    quantity = rng.integers(1, 6, len(ids))
+    unit_price = (rng.integers(10, 500, len(ids)) * 1000).astype(float)
+    return pd.DataFrame({
+        "order_detail_id": ids,
+        # three details per order
+        "order_id": (ids - 1) // 3 + 1,
+        "product_id": rng.integers(1, sizes["products"] + 1, len(ids)),
+        "quantity": quantity,
+        "unit_price": unit_price,
+        "subtotal": quantity * unit_price,
+    })
+
+
+def inventory_tracking(rng, start: int, stop: int, sizes: dict) -> pd.DataFrame:
+    ids = _ids(start, stop)
+    return pd.DataFrame({
+        "tracking_id": ids,
+        "product_id": rng.integers(1, sizes["products"] + 1, len(ids)),
+        "quantity_change": rng.integers(-50, 100, len(ids)),
+        "change_date": _dates(rng, len(ids)).date,
+        "reason": rng.choice(REASONS, len(ids)),
+    })
+
+
+def store_branch() -> pd.DataFrame:
+    # substitute for the store_branch Google Sheet: same shape as extract_sheet output (text values)
+    return pd.DataFrame({
+        "store_id": [str(index + 1) for index in range(len(STORES))],
+        "store_name": STORES,
+        "city": [name.split(" ")[1] for name in STORES],
+    })
+
+
+generators = {
+    "customers": customers,
+    "employees": employees,
+    "products": products,
+    "orders": orders,
+    "order_details": order_details,
+    "inventory_tracking": inventory_tracking,
+}
+
+
+def generate(table_name: str, orders: int, chunksize: int = 1_000_000, seed: int = 42):
+    """
+    this function yields the synthetic rows of a source table in chunks of at most chunksize rows.
+    """
+    sizes = table_sizes(orders)
+    rng = np.random.default_rng([seed, list(generators).index(table_name)])
+    for start in range(0, sizes[table_name], chunksize):
+        stop = min(start + chunksize, sizes[table_name])
+        yield generators[table_name](rng, start, stop, sizes)
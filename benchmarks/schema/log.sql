@@ -0,0 +1,9 @@
+CREATE TABLE etl_log (
+    log_id SERIAL PRIMARY KEY,
+    step TEXT,
+    component TEXT,
+    status TEXT,
+    table_name TEXT,
+    etl_date TIMESTAMP,
+    error_msg TEXT
+);
@@ -0,0 +1,60 @@
+CREATE TABLE customers (
+    customer_id INT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    phone TEXT,
+    loyalty_points INT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE employees (
+    employee_id INT PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    hire_date DATE,
+    role TEXT,
+    email TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE products (
+    product_id INT PRIMARY KEY,
+    product_name TEXT,
+    category TEXT,
+    unit_price TEXT,
+    cost_price TEXT,
+    in_stock BOOLEAN,
+    store_branch TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE orders (
+    order_id INT PRIMARY KEY,
+    customer_id INT,
+    employee_id INT,
+    order_date TIMESTAMP,
+    total_amount NUMERIC(12, 2),
+    payment_method TEXT,
+    order_status TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE order_details (
+    order_detail_id INT PRIMARY KEY,
+    order_id INT,
+    product_id INT,
+    quantity INT,
+    unit_price NUMERIC(12, 2),
+    subtotal NUMERIC(12, 2),
+    created_at TIMESTAMP DEFAULT now()
+);
+
+CREATE TABLE inventory_tracking (
+    tracking_id INT PRIMARY KEY,
+    product_id INT,
+    quantity_change INT,
+    change_date DATE,
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT now()
+);
@@ -0,0 +1,67 @@
+CREATE TABLE dim_customers (
+    sk_customer_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_customer_id INT,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    phone TEXT,
+    loyalty_points INT,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE dim_employees (
+    sk_employee_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_employee_id INT,
+    first_name TEXT,
+    last_name TEXT,
+    hire_date INT,
+    role TEXT,
+    email TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE dim_store_branch (
+    sk_store_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_store_id INT,
+    store_name TEXT,
+    city TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE dim_products (
+    sk_product_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_product_id INT,
+    sk_store_branch UUID,
+    product_name TEXT,
+    category TEXT,
+    unit_price DOUBLE PRECISION,
+    cost_price DOUBLE PRECISION,
+    in_stock BOOLEAN,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE fct_order (
+    sk_order_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_order_id INT,
+    sk_employee_id UUID,
+    sk_customer_id UUID,
+    sk_product_id UUID,
+    order_date INT,
+    total_amount NUMERIC(12, 2),
+    quantity INT,
+    unit_price NUMERIC(12, 2),
+    subtotal NUMERIC(12, 2),
+    payment_method TEXT,
+    order_status TEXT,
+    created_at TIMESTAMP
+);
+
+CREATE TABLE fct_inventory (
+    sk_tracking_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    nk_tracking_id INT,
+    sk_product_id UUID,
+    quantity_change INT,
+    change_date INT,
+    reason TEXT,
+    created_at TIMESTAMP
+);
@@ -1,62 +1,651 @@
+from datetime import datetime
+import argparse
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+import time
 
-from src.utils.config import source,sheets
-from src.integration.staging.load import load_staging
-from src.utils.helper import list_tables
+from src.utils.config import source,sheets,staging,warehouse,extract,incremental,parallel,pushdown,change_detection,stream_join,fact_stream,planner
 
-#Staging
-from src.integration.staging.extract import extract_database,extract_spreadsheet
+# The pipeline modules (pandas, sqlalchemy, the transforms) are imported by the stages and commands that use them,
+# so --help and list start without them (see benchmarks/bench_startup.py).
 
-#Warehouse
-from src.integration.warehouse.load import load_warehouse
-from src.integration.warehouse.extract import extract_staging
-from src.integration.warehouse.transform import transform_customer,transform_employee,transform_store_branch
-from src.integration.warehouse.transform import transform_product,transform_order,transform_inventory_tracking
 
+def is_incremental(table_name: str):
+    # tables listed in FULL_REFRESH_TABLES are always fully reloaded
+    return incremental['enabled'] and table_name not in incremental['full_refresh']
 
-def data_pipeline():
-    # EL from Source to Staging
-    # Extract and Load from Database
-    list_tables_db = list_tables(source)
-    for index,row in list_tables_db.iterrows():
-        data = extract_database(table_name=row['table_name'])
-        load_staging(data=data, table_name=row['table_name'], source="database")
+
+# natural key of each warehouse table, used by change detection
+natural_keys = {
+    "dim_customers": "nk_customer_id",
+    "dim_employees": "nk_employee_id",
+    "dim_store_branch": "nk_store_id",
+    "dim_products": "nk_product_id",
+    "fct_order": "nk_order_id",
+    "fct_inventory": "nk_tracking_id",
+}
+
+
+def stage_rows(data, table_name: str):
+    # with CHANGE_DETECTION=true only new or changed rows are loaded, their hashes are committed after the load
+    from src.integration.staging.load import load_staging, primary_key
+    if not change_detection['enabled'] or data is None or data.empty:
+        return load_staging(data=data, table_name=table_name, source="database")
+
+    from src.utils.engine import get_engine
+    from src.utils.rowhash import changed_rows, commit_row_hashes
+    data, hashes = changed_rows(staging, 'staging', table_name, data, keys=primary_key(get_engine(staging), table_name))
+    loaded = data.empty or load_staging(data=data, table_name=table_name, source="database")
+    if loaded:
+        commit_row_hashes(staging, table_name, hashes)
+    return loaded
+
+
+def load_target(data, target_table: str):
+    # with CHANGE_DETECTION=true only new or changed rows are loaded, their hashes are committed after the load
+    from src.integration.warehouse.load import load_warehouse
+    if not change_detection['enabled'] or data is None:
+        return load_warehouse(data=data, table_name=target_table, source='staging')
+
+    from src.utils.rowhash import changed_rows, commit_row_hashes
+    data, hashes = changed_rows(warehouse, 'warehouse', target_table, data, keys=[natural_keys[target_table]])
+    loaded = data.empty or load_warehouse(data=data, table_name=target_table, source='staging')
+    if loaded:
+        commit_row_hashes(warehouse, target_table, hashes)
+    return loaded
+
+
+def load_target_chunks(chunks, target_table: str):
+    """
+    this function loads the chunks of a streamed target with load_target, except for a partitioned fact table
+    (FACT_PARTITIONS=true) whose chunks are loaded in one transaction that swaps each month once. Errors of the
+    chunk generator and of the partitioned load are re-raised.
+    """
+    from src.integration.warehouse.load import load_warehouse_chunks, partitioned_load
+    from src.utils.rowhash import changed_rows, commit_row_hashes
+    if not partitioned_load(target_table):
+        loaded = True
+        for data in chunks:
+            loaded = load_target(data, target_table) and loaded
+        return loaded
+
+    hashes = []
+
+    def changed(chunks):
+        # with CHANGE_DETECTION=true only new or changed rows, their hashes are committed after the swap
+        for data in chunks:
+            if change_detection['enabled']:
+                data, chunk_hashes = changed_rows(warehouse, 'warehouse', target_table, data, keys=[natural_keys[target_table]])
+                hashes.append(chunk_hashes)
+            yield data
+
+    load_warehouse_chunks(changed(chunks), target_table, source='staging')
+    for chunk_hashes in hashes:
+        commit_row_hashes(warehouse, target_table, chunk_hashes)
+    return True
+
+
+# staging watermarks committed by this run, read by the warehouse windows instead of querying etl_log
+_staged = {}
+
+
+def stage_table(table_name: str):
+    """
+    this function extracts a source table (only rows changed since the last watermark in incremental mode),
+    loads it into staging and commits the new watermark once the load succeeded.
+    On a resumed run, a table already loaded is skipped and an extracted frame is loaded from its checkpoint.
+    """
+    from src.utils.checkpoint import save_frame, load_frame, mark_done, is_done
+    from src.utils.helper import get_watermark, commit_watermark, source_clock
+    from src.utils.engine import get_engine
+    from src.utils.handoff import put_frame
+    from src.integration.staging.load import primary_key
+    from src.integration.staging.extract import extract_database, extract_database_chunks
+
+    if is_done('staging', table_name):
+        print(f"[checkpoint] staging {table_name}: already loaded, skipped")
+        return True
+
+    watermark = get_watermark(step='staging', table_name=table_name) if is_incremental(table_name) else None
+    # taken before the extraction, on the clock of the source database the created_at/updated_at come from
+    run_date = source_clock(source)
+
+    if table_name in extract['stream_tables']:
+        # large tables: pass each chunk straight to staging
+        loaded = True
+        try:
+            chunksize = extract['table_chunksize'].get(table_name, extract['chunksize'])
+            for data in extract_database_chunks(table_name=table_name, chunksize=chunksize, watermark=watermark):
+                loaded = stage_rows(data, table_name) and loaded
+        except Exception:
+            # failure is already in etl_log
+            loaded = False
+    else:
+        data = load_frame('extract', table_name)
+        if data is not None:
+            run_date = data.attrs['etl_date'] or run_date
+        else:
+            data = extract_database(table_name=table_name, watermark=watermark)
+            save_frame('extract', table_name, data, etl_date=run_date)
+
+        if data is not None and data.empty:
+            # nothing changed since the last watermark
+            loaded = True
+        else:
+            loaded = stage_rows(data, table_name)
+
+        # full load: hand the frame to the warehouse phase, staging stays the durable copy
+        # (with change detection the warehouse transforms still need every row, so they read staging)
+        if loaded and watermark is None and not change_detection['enabled']:
+            # the rows staging kept: the upsert keeps the last row of a duplicated primary key
+            pk = primary_key(get_engine(staging), table_name)
+            put_frame(table_name, data.drop_duplicates(subset=pk, keep='last').reset_index(drop=True))
+
+    if loaded:
+        commit_watermark(step='staging', table_name=table_name, etl_date=run_date)
+        _staged[table_name] = run_date
+        mark_done('staging', table_name)
+    return loaded
+
+
+def stage_spreadsheet(worksheet_name: str):
+    from src.utils.checkpoint import save_frame, load_frame, mark_done, is_done
+    from src.integration.staging.load import load_staging
+    from src.integration.staging.extract import extract_spreadsheet
+
+    if is_done('staging', worksheet_name):
+        print(f"[checkpoint] staging {worksheet_name}: already loaded, skipped")
+        return True
 
     # Extract and Load from Spreadsheet
-    data = extract_spreadsheet(worksheet_name='store_branch', key_file=sheets['key_spreadsheet'])
-    load_staging(data=data, table_name='store_branch', source="spreadsheet")
-
-    
-    #ETL to Data Warehouse
-    # customers done
-    df_customers = extract_staging(table_name='customers')
-    df_customers_transformed = transform_customer(data = df_customers,table_name='customers')
-    load_warehouse(data=df_customers_transformed, table_name='dim_customers', source='staging')
-
-    # #employee done
-    df_employee = extract_staging(table_name='employees')
-    df_employee_transformed = transform_employee(data = df_employee,table_name='employees')
-    load_warehouse(data=df_employee_transformed, table_name='dim_employees', source='staging')
-
-    # # store branch done
-    df_store_branch = extract_staging(table_name='store_branch')
-    df_store_branch = transform_store_branch(data = df_store_branch,table_name='store_branch')
-    load_warehouse(data=df_store_branch, table_name='dim_store_branch', source='staging')
-
-
-    # # product done
-    df_product = extract_staging(table_name='products')
-    df_product_transformed = transform_product(data = df_product,table_name='products')
-    load_warehouse(data=df_product_transformed, table_name='dim_products', source='staging')
-
-    # #order
-    df_order = extract_staging(table_name='orders')
-    df_order_transformed = transform_order(data = df_order,table_name='orders')
-    load_warehouse(data=df_order_transformed, table_name='fct_order', source='staging')
-
-    # #inventory tracking
-    df_inventory = extract_staging(table_name='inventory_tracking')
-    df_inventory_transformed = transform_inventory_tracking(data = df_inventory,table_name='inventory')
-    load_warehouse(data=df_inventory_transformed, table_name='fct_inventory', source='staging')
+    data = load_frame('extract', worksheet_name)
+    if data is None:
+        data = extract_spreadsheet(worksheet_name=worksheet_name, key_file=sheets['key_spreadsheet'])
+        save_frame('extract', worksheet_name, data)
+    loaded = load_staging(data=data, table_name=worksheet_name, source="spreadsheet")
+    if loaded:
+        mark_done('staging', worksheet_name)
+    return loaded
+
+
+def run_timed(job, *args):
+    start = time.perf_counter()
+    result = job(*args)
+    return result, time.perf_counter() - start
+
+
+def source_tables():
+    # tables of the source database, like list_tables without loading pandas (used by list)
+    from sqlalchemy import text
+    from src.utils.engine import get_engine
+    with get_engine(source).connect() as conn:
+        return conn.execute(text("""
+            SELECT table_name
+            FROM information_schema.tables
+            WHERE table_schema = 'public';
+        """)).scalars().all()
+
+
+def staging_jobs():
+    # staging job of every source table and of the spreadsheet
+    jobs = {table_name: (stage_table, table_name) for table_name in source_tables()}
+    jobs['store_branch'] = (stage_spreadsheet, 'store_branch')
+    return jobs
+
+
+def staging_phase(workers: int = None, jobs: dict = None):
+    """
+    this function extracts and loads every source table and the spreadsheet (or only `jobs`) into staging concurrently,
+    with at most `workers` jobs at a time (STAGING_WORKERS by default). A failing table does not stop the others.
+    """
+    from src.utils.helper import etl_log
+
+    workers = workers or parallel['staging_workers']
+    jobs = staging_jobs() if jobs is None else jobs
+    if not jobs:
+        return {}
+
+    start = time.perf_counter()
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_timed, *job): table_name for table_name, job in jobs.items()}
+        for future in as_completed(futures):
+            table_name = futures[future]
+            try:
+                results[table_name] = future.result()
+            except Exception as e:
+                # unexpected error in a job, the other tables keep running
+                results[table_name] = (False, None)
+                etl_log({
+                    "step" : "staging",
+                    "component": "staging phase",
+                    "status": "failed",
+                    "table_name": table_name,
+                    "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    "error_msg": str(e)
+                })
+    wall_time = time.perf_counter() - start
+
+    # summary: wall time should be close to the slowest table instead of the sum of all tables
+    failed = [table_name for table_name, (loaded, duration) in results.items() if not loaded]
+    for table_name, (loaded, duration) in sorted(results.items(), key=lambda item: -(item[1][1] or 0)):
+        print(f"[staging] {table_name}: {'success' if loaded else 'failed'}"
+              + (f" in {duration:.2f}s" if duration is not None else ""))
+    print(f"[staging] {len(results)} jobs, {workers} workers, wall time {wall_time:.2f}s, "
+          f"sum of job times {sum(duration or 0 for loaded, duration in results.values()):.2f}s")
+
+    etl_log({
+        "step" : "staging",
+        "component": "staging phase",
+        "status": "failed" if failed else "success",
+        "table_name": ",".join(failed) if failed else "all",
+        "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+        "duration_s": round(wall_time, 3)
+    })
+    return results
+
+
+def warehouse_window(table_name: str, target_table: str):
+    """
+    this function returns the (watermark, until, etl_date) window of a warehouse target. In incremental mode the target
+    reads the staging rows changed after its last watermark and up to the staging watermark of its input table,
+    and that staging watermark becomes its new watermark. The window follows what was staged, not the warehouse run
+    time, so a source row staged by a later run is not skipped. Rows changed after `until` wait for the next window.
+    """
+    from src.utils.helper import get_watermark
+
+    if not is_incremental(table_name):
+        # full reload: no window, the watermark is committed only when this run staged the table
+        return None, None, _staged.get(table_name)
+    if table_name not in _staged:
+        # not staged by this run (warehouse only runs): read once
+        _staged[table_name] = get_watermark(step='staging', table_name=table_name)
+    staged = _staged[table_name]
+    return get_watermark(step='warehouse', table_name=target_table), staged, staged
+
+
+def warehouse_table(table_name: str, target_table: str, transform: str, transform_name: str = None):
+    """
+    this function extracts a staging table (incrementally when enabled), transforms it with the `transform` function
+    of src/integration/warehouse/transform.py and loads it into the warehouse, then commits the new watermark of the
+    target table. On a resumed run, a target already loaded is skipped and a transformed frame is loaded from its checkpoint.
+    """
+    from src.utils.checkpoint import save_frame, load_frame, mark_done, is_done
+    from src.utils.helper import commit_watermark
+    from src.utils.validation import validate
+    from src.integration.warehouse.extract import extract_staging
+    from src.integration.warehouse import transform as transforms
+
+    if is_done('warehouse', target_table):
+        print(f"[checkpoint] warehouse {target_table}: already loaded, skipped")
+        return True
+
+    watermark, until, etl_date = warehouse_window(table_name, target_table)
+
+    data = load_frame('transform', target_table)
+    if data is not None:
+        etl_date = data.attrs['etl_date'] or etl_date
+        loaded = load_target(data, target_table)
+    else:
+        data = extract_staging(table_name=table_name, watermark=watermark, until=until)
+        # rows breaking a validation rule are quarantined, the valid rows go on
+        data = validate(data, table_name)
+        if data is not None and data.empty:
+            # nothing changed since the last watermark (or no valid row)
+            loaded = True
+        else:
+            data = getattr(transforms, transform)(data=data, table_name=transform_name or table_name)
+            save_frame('transform', target_table, data, etl_date=etl_date)
+            loaded = load_target(data, target_table)
+
+    if loaded and etl_date is not None:
+        commit_watermark(step='warehouse', table_name=target_table, etl_date=etl_date)
+    if loaded:
+        mark_done('warehouse', target_table)
+    return loaded
+
+
+def warehouse_table_stream(table_name: str, target_table: str, transform: str, transform_name: str = None, order_by: str = None):
+    """
+    this function is warehouse_table for a target listed in FACT_STREAM_TARGETS: the staging rows of the window are
+    read FACT_STREAM_CHUNKSIZE rows at a time, and each chunk is validated, transformed and loaded before the next.
+    The transform must be row-local for order_by (every row of a key in the same chunk).
+    """
+    from src.utils.checkpoint import mark_done, is_done
+    from src.utils.helper import commit_watermark
+    from src.utils.validation import validate
+    from src.integration.warehouse.extract import extract_staging_chunks
+    from src.integration.warehouse import transform as transforms
+
+    if is_done('warehouse', target_table):
+        print(f"[checkpoint] warehouse {target_table}: already loaded, skipped")
+        return True
+
+    watermark, until, etl_date = warehouse_window(table_name, target_table)
+    # read at call time, the planner may have set it
+    chunksize = fact_stream['chunksize']
+
+    def facts():
+        for data in extract_staging_chunks(table_name, chunksize=chunksize, order_by=order_by, watermark=watermark, until=until):
+            data = validate(data, table_name)
+            if data is None or not data.empty:
+                yield getattr(transforms, transform)(data=data, table_name=transform_name or table_name)
+
+    try:
+        loaded = load_target_chunks(facts(), target_table)
+    except Exception:
+        # failure is already in etl_log
+        loaded = False
+
+    if loaded and etl_date is not None:
+        commit_watermark(step='warehouse', table_name=target_table, etl_date=etl_date)
+    if loaded:
+        mark_done('warehouse', target_table)
+    return loaded
+
+
+def warehouse_inventory():
+    # fct_inventory: in chunks when listed in FACT_STREAM_TARGETS, in memory otherwise
+    if 'fct_inventory' in fact_stream['targets']:
+        return warehouse_table_stream(table_name='inventory_tracking', target_table='fct_inventory',
+                                      transform='transform_inventory_tracking', transform_name='inventory', order_by='tracking_id')
+    return warehouse_table(table_name='inventory_tracking', target_table='fct_inventory',
+                           transform='transform_inventory_tracking', transform_name='inventory')
+
+
+def warehouse_order_stream():
+    """
+    this function loads fct_order with the streaming join (ORDER_STREAM_JOIN=true): the fact rows are loaded
+    chunk by chunk as order_details is streamed from staging.
+    """
+    from src.utils.checkpoint import mark_done, is_done
+    from src.utils.helper import commit_watermark
+    from src.utils.validation import validate
+    from src.integration.warehouse.extract import extract_staging
+    from src.integration.warehouse.transform import transform_order_stream
+
+    if is_done('warehouse', 'fct_order'):
+        print("[checkpoint] warehouse fct_order: already loaded, skipped")
+        return True
+
+    watermark, until, etl_date = warehouse_window('orders', 'fct_order')
+
+    data = validate(extract_staging(table_name='orders', watermark=watermark, until=until), 'orders')
+    if data is not None and data.empty:
+        # nothing changed since the last watermark (or no valid row)
+        loaded = True
+    else:
+        try:
+            loaded = load_target_chunks(transform_order_stream(data=data, table_name='orders'), 'fct_order')
+        except Exception:
+            # failure is already in etl_log
+            loaded = False
+
+    if loaded and etl_date is not None:
+        commit_watermark(step='warehouse', table_name='fct_order', etl_date=etl_date)
+    if loaded:
+        mark_done('warehouse', 'fct_order')
+    return loaded
+
+
+def warehouse_order():
+    """
+    this function loads fct_order with the pandas transform (default) or, with ORDER_PUSHDOWN=true,
+    with the joins pushed down to the warehouse database (ORDER_PUSHDOWN_WRITE=true also inserts there).
+    """
+    from src.utils.checkpoint import mark_done, is_done
+    from src.utils.helper import commit_watermark
+    from src.integration.warehouse.transform import transform_order_pushdown, load_order_pushdown, order_pushdown_enabled, order_pushdown_write
+
+    if pushdown['enabled'] and not order_pushdown_enabled():
+        print("[warehouse] fct_order: ORDER_PUSHDOWN is ignored with VALIDATION=true, the rules run on the pandas path")
+    if stream_join['enabled'] and not order_pushdown_enabled():
+        return warehouse_order_stream()
+    if not order_pushdown_enabled():
+        return warehouse_table(table_name='orders', target_table='fct_order', transform='transform_order')
+
+    if is_done('warehouse', 'fct_order'):
+        print("[checkpoint] warehouse fct_order: already loaded, skipped")
+        return True
+
+    watermark, until, etl_date = warehouse_window('orders', 'fct_order')
+
+    if pushdown['write'] and not order_pushdown_write():
+        print("[warehouse] fct_order: ORDER_PUSHDOWN_WRITE is ignored with CHANGE_DETECTION or FACT_PARTITIONS, the rows go through load_target")
+    if order_pushdown_write():
+        loaded = load_order_pushdown(watermark=watermark, until=until)
+    else:
+        # the fact rows are loaded chunk by chunk as they come out of the warehouse database
+        try:
+            loaded = load_target_chunks(transform_order_pushdown(table_name='orders', watermark=watermark, until=until), 'fct_order')
+        except Exception:
+            # failure is already in etl_log
+            loaded = False
+
+    if loaded and etl_date is not None:
+        commit_watermark(step='warehouse', table_name='fct_order', etl_date=etl_date)
+    if loaded:
+        mark_done('warehouse', 'fct_order')
+    return loaded
+
+
+# Warehouse task graph: a task runs once every task in its deps has been loaded
+warehouse_tasks = {
+    "dim_customers": {
+        "func": partial(warehouse_table, table_name='customers', target_table='dim_customers', transform='transform_customer'),
+        "deps": []
+    },
+    "dim_employees": {
+        "func": partial(warehouse_table, table_name='employees', target_table='dim_employees', transform='transform_employee'),
+        "deps": []
+    },
+    "dim_store_branch": {
+        "func": partial(warehouse_table, table_name='store_branch', target_table='dim_store_branch', transform='transform_store_branch'),
+        "deps": []
+    },
+    # transform_product looks up sk_store_id in dim_store_branch
+    "dim_products": {
+        "func": partial(warehouse_table, table_name='products', target_table='dim_products', transform='transform_product'),
+        "deps": ["dim_store_branch"]
+    },
+    "fct_order": {
+        "func": warehouse_order,
+        "deps": ["dim_employees", "dim_customers", "dim_products"]
+    },
+    "fct_inventory": {
+        "func": warehouse_inventory,
+        "deps": ["dim_products"]
+    },
+}
+
+
+def select(names: list, only: list = None, exclude: list = None):
+    # names kept by --only/--exclude
+    return [name for name in names if (not only or name in only) and name not in (exclude or [])]
+
+
+def select_stages(only: list = None, exclude: list = None):
+    # staging jobs and warehouse tasks selected by --only/--exclude
+    from src.utils.scheduler import subgraph
+    jobs = staging_jobs()
+    unknown = set(only or []).union(exclude or []) - set(jobs) - set(warehouse_tasks)
+    if unknown:
+        raise ValueError(f"unknown tables: {', '.join(sorted(unknown))}")
+
+    jobs = {table_name: jobs[table_name] for table_name in select(list(jobs), only, exclude)}
+    tasks = subgraph(warehouse_tasks, select(list(warehouse_tasks), only, exclude))
+    if not jobs and not tasks:
+        raise ValueError("no table selected")
+    return jobs, tasks
+
+
+def explain_pipeline(only: list = None, exclude: list = None):
+    """
+    this function prints the plan of a run (see src/utils/planner.py) without running it.
+    """
+    from src.utils.engine import dispose_engines
+    from src.utils.planner import make_plan, explain
+
+    try:
+        jobs, tasks = select_stages(only, exclude)
+        explain(make_plan(list(jobs), list(tasks)))
+    finally:
+        dispose_engines()
+    return True
+
+
+def data_pipeline(resume: str = None, only: list = None, exclude: list = None, plan: bool = None):
+    """
+    this function runs the whole pipeline, or only the staging tables and warehouse targets named in `only`
+    and not in `exclude` (dependencies outside the selection are expected to be loaded already).
+    With resume=<run_id>, stages completed by that run are skipped and saved frames of that run are reused,
+    so only the stages that didn't complete are rerun. With plan=True (PLANNER=true by default) the chunk sizes,
+    streaming paths and workers are picked from the table statistics first. Returns True when every selected stage succeeded.
+    """
+    from src.utils.helper import flush_etl_log
+    from src.utils.engine import engine_stats, dispose_engines
+    from src.utils.scheduler import run_dag
+    from src.utils.metrics import write_metrics, clear_metrics
+    from src.utils.handoff import clear_frames
+    from src.utils.dtypes import dtype_report, clear_dtype_report
+    from src.utils.checkpoint import start_run, cleanup_runs
+    from src.utils.quarantine import flush_quarantine
+    from src.integration.staging.extract import clear_fetched
+    from src.integration.warehouse.keymap import key_map_stats, clear_key_maps
+
+    # an unknown table name fails before a run is started
+    try:
+        jobs, tasks = select_stages(only, exclude)
+    except Exception:
+        dispose_engines()
+        raise
+
+    run_id = start_run(resume)
+    print(f"[checkpoint] run id: {run_id}" + (" (resumed)" if resume else ""))
+    # checkpoints of old runs (CHECKPOINT_RETENTION_DAYS)
+    for old_run in cleanup_runs():
+        print(f"[checkpoint] removed run {old_run}")
+
+    planned = None
+    try:
+        if planner['enabled'] if plan is None else plan:
+            # chunk sizes, streaming paths and workers under MEMORY_BUDGET_MB
+            from src.utils.planner import make_plan, apply_plan, explain
+            run_plan = make_plan(list(jobs), list(tasks))
+            # over budget stages are flagged by explain, the run goes on with the smallest plan
+            explain(run_plan)
+            planned = apply_plan(run_plan)
+
+        # EL from Source to Staging
+        # Extract and Load from Database and Spreadsheet, tables run in parallel
+        staging = staging_phase(workers=parallel['staging_workers'], jobs=jobs)
+        flush_etl_log()
+
+        #ETL to Data Warehouse
+        # independent tasks run concurrently, downstream tasks of a failed task are skipped
+        results = run_dag(tasks, workers=parallel['warehouse_workers'], step="warehouse") if tasks else {}
+
+        return (all(loaded for loaded, duration in staging.values())
+                and all(result['status'] == 'success' for result in results.values()))
+    finally:
+        # staged frames not used by the warehouse phase
+        clear_frames()
+        # worksheets prefetched by the spreadsheet batch and not read
+        clear_fetched()
+        _staged.clear()
+        # the plan applies to this run only
+        if planned is not None:
+            from src.utils.planner import restore_config
+            restore_config(planned)
+
+        # report dimension key map cache usage of this run
+        cache = key_map_stats()
+        print(f"[key map cache] hits: {cache['hits']}, misses: {cache['misses']}, refreshes: {cache['refreshes']}")
+        for table_name, key_map in cache['maps'].items():
+            print(f"[key map cache] {table_name}: {key_map['rows']} keys, {key_map['bytes'] / 1024:.1f} KiB")
+        clear_key_maps()
+
+        # memory saved by the dtype plans of the extracted tables
+        for report in dtype_report():
+            print(f"[dtypes] {report['step']} {report['table_name']}: {report['rows']} rows, "
+                  f"{report['bytes_before'] / 2**20:.2f} MiB -> {report['bytes_after'] / 2**20:.2f} MiB")
+        clear_dtype_report()
+
+        # failed frames still being written to the quarantine
+        flush_quarantine()
+
+        # write the remaining buffered log messages before the log connection is closed
+        flush_etl_log()
+
+        # per-stage metrics of this run for Prometheus (METRICS_TEXTFILE)
+        write_metrics()
+        clear_metrics()
+
+        # report connection usage of this run and close all pooled connections
+        for stats in engine_stats():
+            print(f"[{stats['database']}] connections: {stats['connections']}, checkouts: {stats['checkouts']}, "
+                  f"checkout wait: {stats['checkout_wait_s']:.3f}s, connect: {stats['connect_s']:.3f}s")
+        dispose_engines()
+
+
+def list_stages():
+    # staging tables and warehouse targets accepted by the stage/warehouse/run commands
+    from src.utils.engine import dispose_engines
+
+    print("staging:")
+    for table_name in staging_jobs():
+        print(f"  {table_name}")
+    print("warehouse:")
+    for target_table, task in warehouse_tasks.items():
+        print(f"  {target_table}" + (f" (after {', '.join(task['deps'])})" if task['deps'] else ""))
+    dispose_engines()
+    return True
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline (every stage when no command is given)")
+    parser.add_argument("--resume", metavar="RUN_ID", help="resume a failed run, skipping the stages it completed")
+    parser.add_argument("--plan", action="store_true", default=None, help="plan chunk sizes and workers first (PLANNER=true)")
+    parser.add_argument("--explain", action="store_true", help="print the plan of the run without running it")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    # --resume, --plan and --explain are accepted after the command too
+    resume = argparse.ArgumentParser(add_help=False)
+    resume.add_argument("--resume", metavar="RUN_ID", default=argparse.SUPPRESS,
+                        help="resume a failed run, skipping the stages it completed")
+    resume.add_argument("--plan", action="store_true", default=argparse.SUPPRESS,
+                        help="plan chunk sizes and workers first (PLANNER=true)")
+    resume.add_argument("--explain", action="store_true", default=argparse.SUPPRESS,
+                        help="print the plan of the run without running it")
+
+    run = commands.add_parser("run", parents=[resume], help="run the pipeline, or a selection of its tables")
+    run.add_argument("--only", nargs="+", metavar="TABLE", help="staging tables and warehouse targets to run")
+    run.add_argument("--exclude", nargs="+", metavar="TABLE", help="staging tables and warehouse targets to skip")
+    stage = commands.add_parser("stage", parents=[resume], help="extract and load one table into staging")
+    stage.add_argument("table")
+    target = commands.add_parser("warehouse", parents=[resume], help="transform and load one warehouse target")
+    target.add_argument("target", choices=list(warehouse_tasks))
+    commands.add_parser("list", help="list the staging tables and warehouse targets")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "list":
+            return list_stages()
+        if args.command == "stage":
+            only, exclude = [args.table], list(warehouse_tasks)
+        elif args.command == "warehouse":
+            only, exclude = [args.target], None
+        else:
+            only, exclude = getattr(args, "only", None), getattr(args, "exclude", None)
+
+        if args.explain:
+            return explain_pipeline(only=only, exclude=exclude)
+        return data_pipeline(resume=args.resume, only=only, exclude=exclude, plan=args.plan)
+    except ValueError as e:
+        # unknown table or run id
+        parser.error(str(e))
+
 
 if __name__ == "__main__":
-    data_pipeline()
+    sys.exit(0 if main() else 1)
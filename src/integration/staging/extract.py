@@ -1,35 +1,38 @@
 
-from sqlalchemy import create_engine
+from src.utils.engine import get_engine
 import pandas as pd
-from oauth2client.service_account import ServiceAccountCredentials
-import gspread
+import threading
+import json
+import os
 
-from src.utils.helper import etl_log, read_etl_log
-from src.utils.config import  source,sheets
+from src.utils.metrics import stage_start, stage_metrics
+from src.utils.dtypes import apply_dtype_plan
+from src.utils.helper import etl_log, read_etl_log, incremental_query
+from src.utils.config import  source,sheets,extract
 
 from datetime import datetime
 
 ## Database
-def extract_database(table_name: str): 
+def extract_database(table_name: str, watermark: datetime = None): 
     
+    start = stage_start()
     try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{source['user']}:{source['password']}@{source['host']}:{source['port']}/{source['db']}")
+        # get pooled connection to database
+        conn = get_engine(source)
 
         # Constructs a SQL query to select all columns from the specified table_name where created_at is greater than etl_date.
-        query = f"""
-        SELECT * 
-        FROM {table_name} 
-        """
+        query = incremental_query(conn, table_name, watermark)
 
         #Execute the query with pd.read_sql
-        df = pd.read_sql(sql=query, con=conn)
+        df = pd.read_sql(sql=query, con=conn, params={"watermark": watermark})
+        df = apply_dtype_plan(df, table_name, step="staging")
         log_msg = {
                 "step" : "staging",
                 "component":"extraction database",
                 "status": "success",
                 "table_name": table_name,
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, data=df)
             }
         return df
     except Exception as e:
@@ -39,52 +42,197 @@ def extract_database(table_name: str):
             "status": "failed",
             "table_name": table_name,
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start),
             "error_msg": str(e)
         }
     finally:
         etl_log(log_msg)
 
 
+def extract_database_chunks(table_name: str, chunksize: int = extract['chunksize'], watermark: datetime = None):
+    """
+    this function streams a table through a server-side cursor and yields it in chunks of chunksize rows,
+    so memory depends on the chunk size instead of the table size. Errors are logged and re-raised.
+    """
+    start = stage_start()
+    chunk_start = stage_start()
+    chunk = 0
+    total_rows = 0
+    total_bytes = 0
+    try:
+        # server-side cursor: rows are fetched from postgres chunk by chunk
+        with get_engine(source).connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            query = incremental_query(conn, table_name, watermark)
+
+            for df in pd.read_sql(sql=query, con=conn, params={"watermark": watermark}, chunksize=chunksize):
+                chunk += 1
+                df = apply_dtype_plan(df, table_name, step="staging")
+                total_rows += len(df)
+                total_bytes += int(df.memory_usage(index=False, deep=True).sum())
+                # chunk progress log message, the metrics are those of reading this chunk
+                etl_log({
+                        "step" : "staging",
+                        "component":"extraction database chunk",
+                        "status": "success",
+                        "table_name": table_name,
+                        "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                        **stage_metrics(chunk_start, data=df),
+                        "chunk": chunk,
+                        "rows": total_rows
+                    })
+                yield df
+                chunk_start = stage_start()
+
+        # whole stream: from the first query to the last chunk, including the time spent by the consumer
+        etl_log({
+                "step" : "staging",
+                "component":"extraction database stream",
+                "status": "success",
+                "table_name": table_name,
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, rows=total_rows, bytes_moved=total_bytes),
+                "chunk": chunk
+            })
+    except Exception as e:
+        etl_log({
+            "step" : "staging",
+            "component":"extraction database chunk",
+            "status": "failed",
+            "table_name": table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start, rows=total_rows, bytes_moved=total_bytes),
+            "chunk": chunk + 1,
+            "rows": total_rows,
+            "error_msg": str(e)
+        })
+        raise
+
+
 ## Google Sheet
 
+# the authorised client and the opened spreadsheets are kept for the whole process
+_sheets_client = {"client": None, "spreadsheets": {}}
+# worksheets fetched by a batch and not read yet, per spreadsheet key, with the modified time they were fetched at
+_fetched = {}
+_sheets_lock = threading.Lock()
+
+
 def auth_gspread():
-    scope = ['https://spreadsheets.google.com/feeds',
-             'https://www.googleapis.com/auth/drive']
+    with _sheets_lock:
+        if _sheets_client["client"] is None:
+            # imported here: only the spreadsheet extraction needs the Google client libraries
+            from oauth2client.service_account import ServiceAccountCredentials
+            import gspread
+
+            scope = ['https://spreadsheets.google.com/feeds',
+                     'https://www.googleapis.com/auth/drive']
+
+            #Define your credentials
+            credentials = ServiceAccountCredentials.from_json_keyfile_name(sheets['cred_path'], scope) # Your json file here
+
+            _sheets_client["client"] = gspread.authorize(credentials)
 
-    #Define your credentials
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(sheets['cred_path'], scope) # Your json file here
+        return _sheets_client["client"]
 
-    gc = gspread.authorize(credentials)
+def set_sheets_client(client):
+    """
+    this function replaces the gspread client (e.g. with a local fake) and drops the cached spreadsheets.
+    """
+    with _sheets_lock:
+        _sheets_client["client"] = client
+        _sheets_client["spreadsheets"].clear()
+        _fetched.clear()
 
-    return gc
+def clear_fetched():
+    # drop the worksheets prefetched and not read, so the next run fetches them again
+    with _sheets_lock:
+        _fetched.clear()
 
 def init_key_file(key_file:str):
     #define credentials to open the file
     gc = auth_gspread()
-    
-    #open spreadsheet file by key
-    sheet_result = gc.open_by_key(key_file)
-    
-    return sheet_result
+
+    #open spreadsheet file by key, once per process
+    with _sheets_lock:
+        if key_file not in _sheets_client["spreadsheets"]:
+            _sheets_client["spreadsheets"][key_file] = gc.open_by_key(key_file)
+        return _sheets_client["spreadsheets"][key_file]
+
+def _snapshot_path(key_file: str):
+    return os.path.join(sheets['snapshot_dir'], f"{key_file}.json")
+
+def _read_snapshot(key_file: str):
+    try:
+        with open(_snapshot_path(key_file)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+def _write_snapshot(key_file: str, snapshot: dict):
+    os.makedirs(sheets['snapshot_dir'], exist_ok=True)
+    path = _snapshot_path(key_file)
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(snapshot, file)
+    os.replace(f"{path}.tmp", path)
+
+def _pad(values: list) -> list:
+    # the values API leaves out trailing empty cells, get_all_values() filled them with ''
+    width = max((len(row) for row in values), default=0)
+    return [row + [''] * (width - len(row)) for row in values]
+
+def fetch_worksheets(key_file: str, worksheet_names: list):
+    """
+    this function returns the cell values of several worksheets with one values_batch_get request,
+    whether they came from the "api" or the local "snapshot", and the modified time of the spreadsheet
+    (None when not conditional). In conditional mode (SHEETS_CONDITIONAL) the download is skipped when
+    the spreadsheet wasn't modified since the snapshot was taken.
+    """
+    spreadsheet = init_key_file(key_file)
+
+    modified_time = None
+    if sheets['conditional']:
+        modified_time = spreadsheet.get_lastUpdateTime()
+        snapshot = _read_snapshot(key_file)
+        if snapshot and snapshot["modified_time"] == modified_time and set(worksheet_names) <= set(snapshot["values"]):
+            return {name: snapshot["values"][name] for name in worksheet_names}, "snapshot", modified_time
+
+    ranges = ["'" + name.replace("'", "''") + "'" for name in worksheet_names]
+    response = spreadsheet.values_batch_get(ranges)
+    values = {name: _pad(value_range.get("values", [])) for name, value_range in zip(worksheet_names, response["valueRanges"])}
+
+    if modified_time is not None:
+        snapshot = _read_snapshot(key_file)
+        # worksheets of the same revision are kept together
+        if not snapshot or snapshot["modified_time"] != modified_time:
+            snapshot = {"modified_time": modified_time, "values": {}}
+        snapshot["values"].update(values)
+        _write_snapshot(key_file, snapshot)
+    return values, "api", modified_time
 
 def extract_sheet(key_file:str, worksheet_name: str) -> pd.DataFrame:
-    # init sheet
-    sheet_result = init_key_file(key_file)
-    
-    worksheet_result = sheet_result.worksheet(worksheet_name)
-    
-    df_result = pd.DataFrame(worksheet_result.get_all_values())
-    
-    # set first rows as columns
-    df_result.columns = df_result.iloc[0]
-    
-    # get all the rest of the values
-    df_result = df_result[1:].copy()
-    
+    with _sheets_lock:
+        fetched = _fetched.get(key_file, {}).pop(worksheet_name, None)
+    if fetched is not None and sheets['conditional'] and fetched[2] != init_key_file(key_file).get_lastUpdateTime():
+        # the spreadsheet was modified since the batch was fetched
+        fetched = None
+    if fetched is None:
+        # the first read fetches every configured worksheet in one request, the others read it from _fetched
+        others = [name for name in sheets['worksheets'] if name != worksheet_name]
+        values, sheet_source, modified_time = fetch_worksheets(key_file, [worksheet_name] + others)
+        fetched = (values.pop(worksheet_name), sheet_source, modified_time)
+        with _sheets_lock:
+            _fetched[key_file] = {name: (value, sheet_source, modified_time) for name, value in values.items()}
+    values, sheet_source, modified_time = fetched
+
+    # set first rows as columns, get all the rest of the values
+    df_result = pd.DataFrame(values[1:], columns=values[0] if values else None)
+    df_result.attrs["sheet_source"] = sheet_source
+
     return df_result
 
 def extract_spreadsheet(worksheet_name: str, key_file: str):
 
+    start = stage_start()
     try:
         # extract data
         df_data = extract_sheet(worksheet_name = worksheet_name,
@@ -97,7 +245,9 @@ def extract_spreadsheet(worksheet_name: str, key_file: str):
                 "component":"extraction spreadsheet",
                 "status": "success",
                 "table_name": worksheet_name,
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                "sheet_source": df_data.attrs.get("sheet_source"),
+                **stage_metrics(start, data=df_data)
             }
     except Exception as e:
         # fail log message
@@ -107,6 +257,7 @@ def extract_spreadsheet(worksheet_name: str, key_file: str):
                 "status": "failed",
                 "table_name": worksheet_name,
                 "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start),
                 "error_msg": str(e)
             }
         df_data = pd.DataFrame()
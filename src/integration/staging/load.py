@@ -1,29 +1,51 @@
 
 from datetime import datetime
-from sqlalchemy import create_engine,inspect
-from pangres import upsert
+import threading
+from sqlalchemy import inspect
 
-from src.utils.helper import etl_log, handle_error
-from src.utils.config import staging
+from src.utils.engine import get_engine
+from src.utils.metrics import stage_start, stage_metrics
+from src.utils.helper import etl_log, handle_error, upsert_dataframe
+from src.utils.config import staging, load
 
+_primary_keys = {}
+_lock = threading.Lock()
 
-def load_staging(data, table_name: str, source:str):
+
+def primary_key(conn, table_name: str) -> list:
+    """
+    this function returns the primary key columns of a staging table (composite keys too), looked up once per table.
+    """
+    with _lock:
+        if table_name not in _primary_keys:
+            _primary_keys[table_name] = inspect(conn).get_pk_constraint(table_name)["constrained_columns"]
+        return _primary_keys[table_name]
+
+
+def load_staging(data, table_name: str, source:str, method: str = load['staging_method']):
+    start = stage_start(data)
     try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{staging['user']}:{staging['password']}@{staging['host']}:{staging['port']}/{staging['db']}")
-        
-        # to get primary key of table, for this project all tables have only one primary key
-        inspector = inspect(conn)
-        pk = inspector.get_pk_constraint(table_name)["constrained_columns"][0]
-
-
-        # set data index or primary key
-        data = data.set_index(pk)
-        # Do upsert (Update for existing data and Insert for new data)
-        upsert(con = conn,
-                df = data,
-                table_name = table_name,
-                if_row_exists = "update")
+        # get pooled connection to database
+        conn = get_engine(staging)
+        pk = primary_key(conn, table_name)
+
+        if method == "copy":
+            # COPY into a temp table and upsert with one INSERT ... ON CONFLICT
+            with conn.begin() as connection:
+                inserted, updated = upsert_dataframe(connection, data, table_name=table_name, pk=pk,
+                                                     batch_rows=load['copy_batch_rows'])
+        else:
+            # set data index or primary key, pangres doesn't support categorical columns (dtype plan)
+            data = data.set_index(pk)
+            data = data.astype({column: object for column in data.select_dtypes("category").columns})
+            # imported here: pangres is slow to import and only used by STG_LOAD_METHOD=pangres
+            from pangres import upsert
+            # Do upsert (Update for existing data and Insert for new data)
+            upsert(con = conn,
+                    df = data,
+                    table_name = table_name,
+                    if_row_exists = "update")
+            inserted, updated = None, None
         
         component = f"load from {source}"
         #create success log message
@@ -32,7 +54,11 @@ def load_staging(data, table_name: str, source:str):
                 f"component": component,
                 "status": "success",
                 "table_name": table_name,
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                "load_method": method,
+                "rows_inserted": inserted,
+                "rows_updated": updated,
+                **stage_metrics(start, data=data)
             }
         # return data
     except Exception as e:
@@ -43,6 +69,7 @@ def load_staging(data, table_name: str, source:str):
             "status": "failed",
             "table_name": table_name,
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S") , # Current timestamp
+            **stage_metrics(start),
             "error_msg": str(e)
         }
 
@@ -54,4 +81,5 @@ def load_staging(data, table_name: str, source:str):
     finally:
         etl_log(log_msg)
 
-    
\ No newline at end of file
+    # tell the caller whether the load succeeded
+    return log_msg['status'] == 'success'
@@ -1,32 +1,43 @@
 
-from sqlalchemy import create_engine
+from src.utils.engine import get_engine
+from sqlalchemy import text
 import pandas as pd
 from datetime import datetime
 
-from src.utils.helper import etl_log
+from src.utils.metrics import stage_start, stage_metrics
+from src.utils.helper import etl_log, incremental_query
+from src.utils.handoff import take_frame
+from src.utils.dtypes import apply_dtype_plan
 from src.utils.config import  staging,warehouse
 
 
-def extract_staging(table_name: str): 
+def extract_staging(table_name: str, watermark: datetime = None, until: datetime = None): 
     
+    start = stage_start()
     try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{staging['user']}:{staging['password']}@{staging['host']}:{staging['port']}/{staging['db']}")
+        # full extraction of a table staged in this run: reuse the staged frame instead of reading it back
+        df = take_frame(table_name) if watermark is None and until is None else None
+        component = "extraction handoff"
 
-        # Constructs a SQL query to select all columns from the specified table_name where created_at is greater than etl_date.
-        query = f"""
-        SELECT * 
-        FROM {table_name} 
-        """
+        if df is None:
+            # get pooled connection to database
+            conn = get_engine(staging)
+
+            # Constructs a SQL query to select all columns from the specified table_name where created_at is greater than etl_date.
+            query = incremental_query(conn, table_name, watermark, until)
+
+            #Execute the query with pd.read_sql
+            df = pd.read_sql(sql=query, con=conn, params={"watermark": watermark, "until": until})
+            df = apply_dtype_plan(df, table_name, step="warehouse")
+            component = "extraction database"
 
-        #Execute the query with pd.read_sql
-        df = pd.read_sql(sql=query, con=conn)
         log_msg = {
                 "step" : "warehouse",
-                "component":"extraction database",
+                "component":component,
                 "status": "success",
                 "table_name": table_name,
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, data=df)
             }
         return df
     except Exception as e:
@@ -36,22 +47,84 @@ def extract_staging(table_name: str):
             "status": "failed",
             "table_name": table_name,
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start),
             "error_msg": str(e)
         }
     finally:
         etl_log(log_msg)
 
+def extract_staging_chunks(table_name: str, chunksize: int, order_by: str = None, watermark: datetime = None,
+                           until: datetime = None):
+    """
+    this function streams a staging table through a server-side cursor, optionally sorted by order_by and
+    limited to the rows changed in the (watermark, until] window, and yields it in chunks of chunksize rows.
+    Errors are logged and re-raised.
+    """
+    start = stage_start()
+    chunk_start = stage_start()
+    chunk = 0
+    total_rows = 0
+    total_bytes = 0
+    try:
+        # server-side cursor: rows are fetched from postgres chunk by chunk
+        with get_engine(staging).connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            query = incremental_query(conn, table_name, watermark, until).text + (f" ORDER BY {order_by}" if order_by else "")
+
+            for df in pd.read_sql(sql=text(query), con=conn, params={"watermark": watermark, "until": until}, chunksize=chunksize):
+                chunk += 1
+                df = apply_dtype_plan(df, table_name, step="warehouse")
+                total_rows += len(df)
+                total_bytes += int(df.memory_usage(index=False, deep=True).sum())
+                # chunk progress log message, the metrics are those of reading this chunk
+                etl_log({
+                        "step" : "warehouse",
+                        "component":"extraction database chunk",
+                        "status": "success",
+                        "table_name": table_name,
+                        "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                        **stage_metrics(chunk_start, data=df),
+                        "chunk": chunk,
+                        "rows": total_rows
+                    })
+                yield df
+                chunk_start = stage_start()
+
+        # whole stream: from the first query to the last chunk, including the time spent by the consumer
+        etl_log({
+                "step" : "warehouse",
+                "component":"extraction database stream",
+                "status": "success",
+                "table_name": table_name,
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, rows=total_rows, bytes_moved=total_bytes),
+                "chunk": chunk
+            })
+    except Exception as e:
+        etl_log({
+            "step" : "warehouse",
+            "component":"extraction database chunk",
+            "status": "failed",
+            "table_name": table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start, rows=total_rows, bytes_moved=total_bytes),
+            "chunk": chunk + 1,
+            "rows": total_rows,
+            "error_msg": str(e)
+        })
+        raise
+
 def extract_target(table_name: str):
     """
     this function is used to extract data from the data warehouse.
     """
-    conn = create_engine(f"postgresql+psycopg2://{warehouse['user']}:{warehouse['password']}@{warehouse['host']}:{warehouse['port']}/{warehouse['db']}")
+    conn = get_engine(warehouse)
 
     # Constructs a SQL query to select all columns from the specified table_name where created_at is greater than etl_date.
     query = f"SELECT * FROM {table_name}"
 
     # Execute the query with pd.read_sql
     df = pd.read_sql(sql=query, con=conn)
+    df = apply_dtype_plan(df, table_name, step="target")
     
     return df
 
@@ -0,0 +1,72 @@
+
+import threading
+
+import pandas as pd
+
+from src.utils.engine import get_engine
+from src.utils.config import warehouse
+
+# dimension table -> (natural key column, surrogate key column) used by the fact/product lookups
+dimension_keys = {
+    "dim_employees": ("nk_employee_id", "sk_employee_id"),
+    "dim_customers": ("nk_customer_id", "sk_customer_id"),
+    "dim_products": ("nk_product_id", "sk_product_id"),
+    "dim_store_branch": ("store_name", "sk_store_id"),
+}
+
+_key_maps = {}
+_stats = {"hits": 0, "misses": 0, "refreshes": 0}
+_lock = threading.Lock()
+
+
+def key_map_query(table_name: str) -> str:
+    # key pairs of a dimension ordered by natural key then surrogate key, so duplicate natural keys always
+    # resolve to the same surrogate key (get_key_map keeps the first row, the pushdown uses DISTINCT ON)
+    nk, sk = dimension_keys[table_name]
+    return f"SELECT {nk}, {sk} FROM public.{table_name} ORDER BY {nk}, {sk}"
+
+
+def get_key_map(table_name: str) -> pd.Series:
+    """
+    this function returns the natural key -> surrogate key map of a dimension as a Series indexed by the natural key.
+    Only the two key columns are read, once per run, and shared by every transform.
+    """
+    with _lock:
+        if table_name in _key_maps:
+            _stats["hits"] += 1
+            return _key_maps[table_name]
+
+        _stats["misses"] += 1
+        nk, sk = dimension_keys[table_name]
+        df = pd.read_sql(sql=key_map_query(table_name), con=get_engine(warehouse))
+
+        # keep the first surrogate key of a natural key (lowest sk), the same one as the order pushdown
+        key_map = df.drop_duplicates(subset=[nk]).set_index(nk)[sk]
+        _key_maps[table_name] = key_map
+        return key_map
+
+
+def refresh_key_map(table_name: str):
+    """
+    this function drops the cached map of a dimension after it was written, so the next lookup reloads it.
+    """
+    with _lock:
+        if _key_maps.pop(table_name, None) is not None:
+            _stats["refreshes"] += 1
+
+
+def key_map_stats():
+    """
+    this function returns the cache hit/miss/refresh counts and the memory used by each cached map.
+    """
+    with _lock:
+        stats = dict(_stats)
+        stats["maps"] = {table_name: {"rows": len(key_map), "bytes": int(key_map.memory_usage(deep=True))}
+                         for table_name, key_map in _key_maps.items()}
+    return stats
+
+
+def clear_key_maps():
+    with _lock:
+        _key_maps.clear()
+        _stats.update({"hits": 0, "misses": 0, "refreshes": 0})
@@ -1,19 +1,47 @@
 
 from datetime import datetime
-from sqlalchemy import create_engine
-from pangres import upsert
+import time
 
-from src.utils.helper import etl_log, handle_error
-from src.utils.config import warehouse
+from src.utils.engine import get_engine
+from src.utils.metrics import stage_start, stage_metrics
+from src.utils.helper import etl_log, handle_error, copy_dataframe
+from src.utils.config import warehouse, load, partitions
+from src.integration.warehouse.keymap import refresh_key_map
+from src.integration.warehouse.partition import partition_keys, is_partitioned, load_partitions, stage_partition_rows, swap_partitions
+
+
+def partitioned_load(table_name: str):
+    # FACT_PARTITIONS=true and the fact table is partitioned: a fact table that isn't partitioned (yet) gets the plain load
+    if not partitions['enabled'] or table_name not in partition_keys:
+        return False
+    with get_engine(warehouse).connect() as connection:
+        return is_partitioned(connection, table_name)
 
 
 def load_warehouse(data, table_name: str, source:str):
+    start = stage_start(data)
     try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{warehouse['user']}:{warehouse['password']}@{warehouse['host']}:{warehouse['port']}/{warehouse['db']}")
+        # get pooled connection to database
+        conn = get_engine(warehouse)
 
+        load_start = time.perf_counter()
+        method = load['method']
+        swapped = None
+        if partitioned_load(table_name):
+            # monthly partitions are rebuilt and swapped in one transaction
+            method = "partition swap"
+            with conn.begin() as connection:
+                swapped = load_partitions(connection, data, table_name=table_name, batch_rows=load['copy_batch_rows'])
+        elif method == 'copy':
+            # bulk load with COPY FROM STDIN, all batches in one transaction
+            with conn.begin() as connection:
+                copy_dataframe(connection, data, table_name=table_name, schema='public', batch_rows=load['copy_batch_rows'])
+        else:
+            data.to_sql(table_name, conn, schema='public', if_exists='append', index=False)
+        duration = time.perf_counter() - load_start
 
-        data.to_sql(table_name, conn, schema='public', if_exists='append', index=False)
+        # the dimension changed: cached key map must be reloaded by the next fact transform
+        refresh_key_map(table_name)
 
         component = f"load from {source}"
         #create success log message
@@ -22,7 +50,12 @@ def load_warehouse(data, table_name: str, source:str):
                 "component": component,
                 "status": "success",
                 "table_name": table_name,
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                "load_method": method,
+                "partitions": swapped,
+                **stage_metrics(start, data=data),
+                "rows": len(data),
+                "rows_per_sec": round(len(data) / duration, 2) if duration > 0 else None
             }
         # return data
     except Exception as e:
@@ -33,6 +66,7 @@ def load_warehouse(data, table_name: str, source:str):
             "status": "failed",
             "table_name": table_name,
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S") , # Current timestamp
+            **stage_metrics(start),
             "error_msg": str(e)
         }
 
@@ -44,4 +78,45 @@ def load_warehouse(data, table_name: str, source:str):
     finally:
         etl_log(log_msg)
 
-    
\ No newline at end of file
+    # tell the caller whether the load succeeded
+    return log_msg['status'] == 'success'
+
+
+def load_warehouse_chunks(chunks, table_name: str, source: str):
+    """
+    this function loads the chunks of a partitioned fact table in one transaction: every chunk is staged in a temp table
+    and each month is swapped once at the end, however many chunks it has rows in. Errors are logged and re-raised.
+    """
+    start = stage_start()
+    rows = 0
+    nbytes = 0
+    try:
+        with get_engine(warehouse).begin() as connection:
+            for data in chunks:
+                stage_partition_rows(connection, data, table_name=table_name, batch_rows=load['copy_batch_rows'])
+                rows += len(data)
+                nbytes += int(data.memory_usage(index=False, deep=True).sum())
+            swapped = swap_partitions(connection, table_name=table_name)
+
+        etl_log({
+                "step" : "warehouse",
+                "component": f"load from {source}",
+                "status": "success",
+                "table_name": table_name,
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                "load_method": "partition swap",
+                "partitions": swapped,
+                **stage_metrics(start, rows=rows, bytes_moved=nbytes),
+                "rows": rows
+            })
+    except Exception as e:
+        etl_log({
+            "step" : "warehouse",
+            "component": source,
+            "status": "failed",
+            "table_name": table_name,
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start, rows=rows, bytes_moved=nbytes),
+            "error_msg": str(e)
+        })
+        raise
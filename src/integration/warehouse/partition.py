@@ -0,0 +1,123 @@
+
+import pandas as pd
+from sqlalchemy import text
+
+from src.utils.helper import copy_dataframe, cast_integer_columns
+
+# Fact tables that can be range partitioned by month on their YYYYMMDD date key: table -> (date key, natural key)
+partition_keys = {
+    "fct_order": ("order_date", "nk_order_id"),
+    "fct_inventory": ("change_date", "nk_tracking_id"),
+}
+
+
+def is_partitioned(connection, table_name: str, schema: str = 'public'):
+    relkind = connection.execute(text("""
+        SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :table_name
+    """), {"schema": schema, "table_name": table_name}).scalar()
+    return relkind == 'p'
+
+
+def month_range(month: int):
+    # month is YYYYMM, the partition holds the date keys [YYYYMM01, next month 01)
+    year, number = divmod(month, 100)
+    upper = (year + 1) * 100 + 1 if number == 12 else month + 1
+    return month * 100 + 1, upper * 100 + 1
+
+
+def partition_name(table_name: str, month: int):
+    return f"{table_name}_p{month}"
+
+
+def create_partition(connection, table_name: str, month: int, schema: str = 'public'):
+    lower, upper = month_range(month)
+    connection.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.{partition_name(table_name, month)}
+        PARTITION OF {schema}.{table_name} FOR VALUES FROM ({lower}) TO ({upper})
+    """)
+
+
+def reload_table(table_name: str):
+    # temp table collecting the rows of one load of a partitioned fact table, dropped at commit
+    return f"{table_name}_reload"
+
+
+def stage_partition_rows(connection, data: pd.DataFrame, table_name: str, schema: str = 'public', batch_rows: int = 100000):
+    """
+    this function adds rows to the reload temp table of a partitioned fact table, on the given connection.
+    A chunked load stages every chunk first and swaps the partitions once with swap_partitions.
+    """
+    reload = reload_table(table_name)
+    connection.exec_driver_sql(f"CREATE TEMP TABLE IF NOT EXISTS {reload} (LIKE {schema}.{table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+    data = cast_integer_columns(connection, data, table_name, schema)
+    copy_dataframe(connection, data, table_name=reload, schema='pg_temp', batch_rows=batch_rows, cast=False)
+
+
+def swap_partitions(connection, table_name: str, schema: str = 'public'):
+    """
+    this function loads the staged rows of a partitioned fact table partition by partition, on the given connection
+    (one transaction). Every month with staged rows, or with old rows of a staged natural key (a key whose date moved),
+    is built in a new table with the rows of its current partition whose key is not reloaded plus its staged rows, then
+    swapped in with DETACH/ATTACH, so loading the same rows twice gives the same table. Rows without a date key go to
+    the default partition. It returns the number of partitions swapped.
+    """
+    date_key, natural_key = partition_keys[table_name]
+    reload = reload_table(table_name)
+    connection.exec_driver_sql(f"CREATE TABLE IF NOT EXISTS {schema}.{table_name}_default PARTITION OF {schema}.{table_name} DEFAULT")
+    connection.exec_driver_sql(f"CREATE INDEX ON pg_temp.{reload} ({natural_key})")
+    connection.exec_driver_sql(f"ANALYZE pg_temp.{reload}")
+    reloaded = f"EXISTS (SELECT 1 FROM pg_temp.{reload} r WHERE r.{natural_key} = old.{natural_key})"
+
+    # months of the staged rows and months still holding rows of the staged keys
+    months = connection.exec_driver_sql(f"""
+        SELECT {date_key} / 100 FROM pg_temp.{reload} WHERE {date_key} IS NOT NULL
+        UNION
+        SELECT {date_key} / 100 FROM {schema}.{table_name} old WHERE {date_key} IS NOT NULL AND {reloaded}
+        ORDER BY 1
+    """).scalars().all()
+    for month in months:
+        month = int(month)
+        name = partition_name(table_name, month)
+        lower, upper = month_range(month)
+        # make sure the partition exists so the swap always has a partition to replace
+        create_partition(connection, table_name, month, schema)
+
+        new = f"{name}_new"
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {schema}.{new}")
+        connection.exec_driver_sql(f"CREATE TABLE {schema}.{new} (LIKE {schema}.{table_name} INCLUDING DEFAULTS)")
+        connection.exec_driver_sql(f"""
+            INSERT INTO {schema}.{new}
+            SELECT * FROM pg_temp.{reload} WHERE {date_key} >= {lower} AND {date_key} < {upper}
+        """)
+        connection.exec_driver_sql(f"""
+            INSERT INTO {schema}.{new}
+            SELECT * FROM {schema}.{name} old WHERE NOT {reloaded}
+        """)
+        # the check constraint lets ATTACH skip the validation scan
+        connection.exec_driver_sql(f"""
+            ALTER TABLE {schema}.{new} ADD CONSTRAINT {new}_range
+            CHECK ({date_key} IS NOT NULL AND {date_key} >= {lower} AND {date_key} < {upper})
+        """)
+
+        connection.exec_driver_sql(f"ALTER TABLE {schema}.{table_name} DETACH PARTITION {schema}.{name}")
+        connection.exec_driver_sql(f"DROP TABLE {schema}.{name}")
+        connection.exec_driver_sql(f"ALTER TABLE {schema}.{new} RENAME TO {name}")
+        connection.exec_driver_sql(f"ALTER TABLE {schema}.{table_name} ATTACH PARTITION {schema}.{name} FOR VALUES FROM ({lower}) TO ({upper})")
+        connection.exec_driver_sql(f"ALTER TABLE {schema}.{name} DROP CONSTRAINT {new}_range")
+
+    # default partition: the reloaded keys are replaced, wherever their new rows go
+    connection.exec_driver_sql(f"DELETE FROM {schema}.{table_name}_default old WHERE {reloaded}")
+    connection.exec_driver_sql(f"INSERT INTO {schema}.{table_name}_default SELECT * FROM pg_temp.{reload} WHERE {date_key} IS NULL")
+    connection.exec_driver_sql(f"DROP TABLE pg_temp.{reload}")
+
+    return len(months)
+
+
+def load_partitions(connection, data: pd.DataFrame, table_name: str, schema: str = 'public', batch_rows: int = 100000):
+    """
+    this function loads the rows of a monthly partitioned fact table with partition swaps (see swap_partitions),
+    on the given connection (one transaction). It returns the number of partitions swapped.
+    """
+    stage_partition_rows(connection, data, table_name, schema, batch_rows)
+    return swap_partitions(connection, table_name, schema)
@@ -1,12 +1,29 @@
+import numpy as np
 import pandas as pd
 import re
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from datetime import datetime
 
-from src.integration.warehouse.extract import extract_target,extract_staging
+from src.integration.warehouse.extract import extract_staging,extract_staging_chunks
+from src.integration.warehouse.keymap import get_key_map, key_map_query
+from src.utils.metrics import stage_start, stage_metrics
 from src.utils.helper import etl_log, handle_error
+from src.utils.engine import get_engine
+from src.utils.coerce import coerce_columns
+from src.utils.validation import validate
+from src.utils.parallel import run_partitioned
+from src.utils.config import warehouse, pushdown, stream_join, validation, change_detection, partitions
+
+# column converters of each transform (see src/utils/coerce.py)
+column_specs = {
+    "employees": {"hire_date": "date_key"},
+    "products": {"unit_price": "currency", "cost_price": "currency"},
+    "orders": {"order_date": "date_key"},
+    "inventory_tracking": {"change_date": "date_key"},
+}
 
 def transform_customer(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    start = stage_start(data)
     try:
         process = "transformation"
 
@@ -31,7 +48,8 @@ def transform_customer(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
                 "component": process,
                 "status": "success",
                 "table_name": "customer",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data)
                 }
         
         return data
@@ -42,6 +60,7 @@ def transform_customer(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
             "status": "failed",
             "table_name": "customer",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -58,6 +77,7 @@ def transform_customer(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
 def transform_employee(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
    
 
+    start = stage_start(data)
     try:
         process = "transformation"
 
@@ -67,10 +87,8 @@ def transform_employee(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
         # remove duplicate nk_employee_id
         data = data.drop_duplicates(subset=['nk_employee_id'])
 
-        # change hire_date format as integer
-
-        data['hire_date'] = pd.to_datetime(data['hire_date'], errors='coerce')
-        data['hire_date'] = data['hire_date'].dt.strftime('%Y%m%d').astype(int)
+        # change hire_date format as integer (YYYYMMDD), invalid dates become null
+        data, invalid = coerce_columns(data, column_specs['employees'])
 
         # change time created_at
         data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
@@ -80,7 +98,9 @@ def transform_employee(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
                 "component": process,
                 "status": "success",
                 "table_name": "employee",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data),
+                    "invalid_values": sum(invalid.values())
                 }
         
         return data
@@ -91,6 +111,7 @@ def transform_employee(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
             "status": "failed",
             "table_name": "employee",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -104,6 +125,7 @@ def transform_employee(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
         etl_log(log_msg)
 
 def transform_store_branch(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    start = stage_start(data)
     try:
         process = "transformation"
 
@@ -121,7 +143,8 @@ def transform_store_branch(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
                 "component": process,
                 "status": "success",
                 "table_name": "store_branch",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data)
                 }
         
         return data
@@ -132,6 +155,7 @@ def transform_store_branch(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
             "status": "failed",
             "table_name": "store_branch",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -146,36 +170,38 @@ def transform_store_branch(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
 
 
 def transform_product(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    start = stage_start(data)
     try:
         process = "transformation"
 
-        # get store_branch data to merge with product data
-        df_store = extract_target(table_name='dim_store_branch')
-        data = data.merge(df_store[['store_name','sk_store_id']],left_on='store_branch',right_on='store_name', how='inner')
+        # look up sk_store_id of the store branch from the cached dim_store_branch key map (inner join)
+        # a categorical store_branch only maps its categories, astype(object) gives back plain values
+        data['sk_store_branch'] = data['store_branch'].map(get_key_map('dim_store_branch')).astype(object)
+        data = data.dropna(subset=['sk_store_branch'])
 
-        # rename column product_id to nk_product_id and sk_store_id to sk_store_branch
-        data = data.rename(columns={'product_id':'nk_product_id','sk_store_id':'sk_store_branch'})
+        # rename column product_id to nk_product_id
+        data = data.rename(columns={'product_id':'nk_product_id'})
 
         # remove duplicate nk_product_id
         data = data.drop_duplicates(subset=['nk_product_id'])
 
-        # change numeric columns to appropriate data types
-        data['unit_price'] = data['unit_price'].replace(r'[\$,\-]', '', regex=True).astype(float)
-        data['cost_price'] = data['cost_price'].replace(r'[\$,\-]', '', regex=True).astype(float)
-
+        # change price columns from currency text to float, invalid prices become null
+        data, invalid = coerce_columns(data, column_specs['products'])
 
          # change time created_at
         data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
 
-        # drop column store_name
-        data = data.drop(columns=['store_name','store_branch'])
+        # drop column store_branch
+        data = data.drop(columns=['store_branch'])
         
         log_msg = {
                 "step" : "warehouse",
                 "component": process,
                 "status": "success",
                 "table_name": "products",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data),
+                    "invalid_values": sum(invalid.values())
                 }
         
         return data
@@ -186,6 +212,7 @@ def transform_product(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
             "status": "failed",
             "table_name": "products",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -198,54 +225,65 @@ def transform_product(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
         # Save the log message
         etl_log(log_msg)
 
-def transform_order(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
-    try:
-        process = "transformation"
+def order_rows(data: pd.DataFrame, details: pd.DataFrame, employee_map: pd.Series, customer_map: pd.Series,
+               product_map: pd.Series) -> pd.DataFrame:
+    """
+    this function is the row-local part of transform_order (no I/O, every row of an order gives the same result
+    whatever the other orders), so it can run on partitions of the orders.
+    """
+    # remove null values
+    data = data.dropna(subset=['customer_id'])
 
-        # remove null values
-        data = data.dropna(subset=['customer_id'])
+    # look up employee and customer surrogate keys from the cached dimension key maps (inner join)
+    data['sk_employee_id'] = data['employee_id'].map(employee_map)
+    data['sk_customer_id'] = data['customer_id'].map(customer_map)
+    data = data.dropna(subset=['sk_employee_id','sk_customer_id'])
 
-        # get employee, customer, product data from warehouse to merge with order data
-        df_emp = extract_target(table_name='dim_employees')
-        df_emp = df_emp[['nk_employee_id','sk_employee_id']]
+    #merging data
+    data = data.merge(details, on='order_id', how='inner')
+    data['sk_product_id'] = data['product_id'].map(product_map)
+    data = data.dropna(subset=['sk_product_id'])
 
-        df_cust = extract_target(table_name='dim_customers')
-        df_cust = df_cust[['nk_customer_id','sk_customer_id']]
+    # rename column order_id to nk_order_id 
+    data = data.rename(columns={'order_id':'nk_order_id'})
 
-        df_prod = extract_target(table_name='dim_products')
-        df_prod = df_prod[['nk_product_id','sk_product_id']]
+    # remove duplicate nk_product_id
+    data = data.drop_duplicates(subset=['nk_order_id'])
+
+    #drop column
+    return data.drop(columns=['employee_id','customer_id','product_id'])
 
-        # get order_details data to merge with order data
-        df_order_details = extract_staging(table_name='order_details')
-        df_order_details = df_order_details.drop(columns=['created_at','order_detail_id'])
 
-        #merging data
-        data = data.merge(df_emp, left_on='employee_id', right_on='nk_employee_id', how='inner')
-        data = data.merge(df_cust, left_on='customer_id', right_on='nk_customer_id', how='inner')
-        data = data.merge(df_order_details, on='order_id', how='inner')
-        data = data.merge(df_prod, left_on='product_id', right_on='nk_product_id', how='inner')
+def transform_order(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    start = stage_start(data)
+    try:
+        process = "transformation"
 
-        # rename column order_id to nk_order_id 
-        data = data.rename(columns={'order_id':'nk_order_id'})
+        # get order_details data to merge with order data
+        df_order_details = validate(extract_staging(table_name='order_details'), 'order_details')
+        # first detail of an order (kept by the dedup below) is the one with the lowest order_detail_id
+        df_order_details = df_order_details.sort_values('order_detail_id', kind='stable')
+        df_order_details = df_order_details.drop(columns=['created_at','order_detail_id'])
 
-        # remove duplicate nk_product_id
-        data = data.drop_duplicates(subset=['nk_order_id'])
+        # join and deduplicate, in TRANSFORM_PROCESSES processes on large inputs
+        data = run_partitioned(order_rows, data, key='order_id', partitioned={'details': (df_order_details, 'order_id')},
+                               employee_map=get_key_map('dim_employees'), customer_map=get_key_map('dim_customers'),
+                               product_map=get_key_map('dim_products'))
 
-        # change order_date format as integer
-        data['order_date'] = data['order_date'].dt.strftime('%Y%m%d').astype(int)
+        # change order_date format as integer (YYYYMMDD), invalid dates become null
+        data, invalid = coerce_columns(data, column_specs['orders'])
 
          # change time created_at
         data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
-
-        #drop column
-        data = data.drop(columns=['nk_employee_id','nk_customer_id','nk_product_id','employee_id','customer_id','product_id'])
         
         log_msg = {
                 "step" : "warehouse",
                 "component": process,
                 "status": "success",
                 "table_name": "order",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data),
+                    "invalid_values": sum(invalid.values())
                 }
         
         return data
@@ -256,6 +294,7 @@ def transform_order(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
             "status": "failed",
             "table_name": "order",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -269,39 +308,265 @@ def transform_order(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
         etl_log(log_msg)
 
 
-def transform_inventory_tracking(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+def transform_order_stream(data: pd.DataFrame, table_name: str, chunksize: int = None):
+    """
+    this function is the streaming join mode of transform_order. The orders and the key maps stay in memory,
+    order_details is read from staging in chunks sorted by order_detail_id and probed against the orders,
+    and the fact rows of each chunk are yielded. An order is emitted once, with its first detail that has a product
+    (lowest order_detail_id), like the dedup of transform_order, so memory is bounded by the orders and one chunk.
+    Errors are logged and re-raised.
+    """
+    # read at call time, the planner may have set it
+    chunksize = chunksize or stream_join['chunksize']
+    start = stage_start(data)
+    process = "transformation stream"
+    chunk = 0
+    rows = 0
+    nbytes = 0
+    invalid_values = 0
     try:
-        process = "transformation"
+        # build side: orders with their employee and customer surrogate keys, one row per order
+        build = data.dropna(subset=['customer_id'])
+        build = build.assign(sk_employee_id=build['employee_id'].map(get_key_map('dim_employees')),
+                             sk_customer_id=build['customer_id'].map(get_key_map('dim_customers')))
+        build = build.dropna(subset=['sk_employee_id','sk_customer_id'])
+        build = build.drop_duplicates(subset=['order_id']).reset_index(drop=True)
+        orders = pd.Index(build['order_id'])
+        emitted = np.zeros(len(build), dtype=bool)
+        product_map = get_key_map('dim_products')
+
+        for details in extract_staging_chunks('order_details', chunksize=chunksize, order_by='order_detail_id'):
+            chunk += 1
+            details = validate(details, 'order_details')
+            details = details.drop(columns=['created_at','order_detail_id'])
+            details = details.assign(sk_product_id=details['product_id'].map(product_map))
+            details = details.dropna(subset=['sk_product_id'])
+
+            # probe: row of the order of each detail in the build side (-1: no such order), skip emitted orders
+            position = orders.get_indexer(details['order_id'])
+            keep = position >= 0
+            keep[keep] = ~emitted[position[keep]]
+            # first detail of each order in this chunk
+            keep[keep] = ~pd.Series(position[keep]).duplicated().to_numpy()
+            details, position = details[keep], position[keep]
+            emitted[position] = True
+
+            fact = pd.concat([build.iloc[position].reset_index(drop=True),
+                              details.drop(columns=['order_id']).reset_index(drop=True)], axis=1)
+            fact = fact.rename(columns={'order_id':'nk_order_id'})
+            fact = fact.drop(columns=['employee_id','customer_id','product_id'])
+
+            # change order_date format as integer (YYYYMMDD), invalid dates become null
+            fact, invalid = coerce_columns(fact, column_specs['orders'])
+            fact['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+
+            rows += len(fact)
+            nbytes += int(fact.memory_usage(index=False, deep=True).sum())
+            invalid_values += sum(invalid.values())
+            yield fact
+
+        etl_log({
+            "step" : "warehouse",
+            "component": process,
+            "status": "success",
+            "table_name": "order",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start, rows=rows, bytes_moved=nbytes),
+            "chunk": chunk,
+            "invalid_values": invalid_values
+        })
+    except Exception as e:
+        etl_log({
+            "step" : "warehouse",
+            "component": process,
+            "status": "failed",
+            "table_name": "order",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start),
+            "chunk": chunk,
+            "error_msg": str(e)
+        })
+        raise
+
+
+def order_pushdown_enabled():
+    # the validation rules run in pandas on the staging rows: with VALIDATION=true fct_order keeps the pandas path,
+    # so rows the rules quarantine are never loaded through the pushdown
+    return pushdown['enabled'] and not validation['enabled']
+
+
+def order_pushdown_write():
+    # INSERT ... SELECT bypasses load_target: with CHANGE_DETECTION (row hashes) or FACT_PARTITIONS (partition swap)
+    # the pushdown rows are read back and loaded by load_target instead
+    return order_pushdown_enabled() and pushdown['write'] and not change_detection['enabled'] and not partitions['enabled']
+
+
+def order_pushdown_query(conn, watermark: datetime = None, until: datetime = None):
+    """
+    this function builds one SQL statement that does the transform_order joins, null filtering, dedup and
+    order_date key inside the warehouse database, reading staging through PUSHDOWN_STAGING_SCHEMA
+    (a postgres_fdw foreign schema or a schema on the same database).
+    """
+    schema = pushdown['staging_schema']
+    inspector = inspect(conn)
+    order_columns = [column['name'] for column in inspector.get_columns('orders', schema=schema)]
+    detail_columns = [column['name'] for column in inspector.get_columns('order_details', schema=schema)]
+
+    # same output columns as the pandas path (clashing names get the merge suffixes _x/_y)
+    order_select = [column for column in order_columns if column not in ('order_id', 'employee_id', 'customer_id', 'order_date', 'created_at')]
+    detail_select = [column for column in detail_columns if column not in ('order_id', 'order_detail_id', 'product_id', 'created_at')]
+    select = ["o.order_id AS nk_order_id"]
+    select += [f"o.{column} AS {column}_x" if column in detail_select else f"o.{column}" for column in order_select]
+    select += ["e.sk_employee_id", "c.sk_customer_id"]
+    select += [f"od.{column} AS {column}_y" if column in order_select else f"od.{column}" for column in detail_select]
+    select += ["p.sk_product_id",
+               "to_char(o.order_date, 'YYYYMMDD')::int AS order_date",
+               "date_trunc('second', localtimestamp) AS created_at"]
+
+    # dimension key maps: first row of each natural key in the order of get_key_map
+    def key_map(table_name, nk, sk):
+        return f"(SELECT DISTINCT ON ({nk}) * FROM ({key_map_query(table_name)}) AS {table_name})"
+
+    filters = ["o.customer_id IS NOT NULL"]
+    timestamps = [column for column in ('created_at', 'updated_at') if column in order_columns]
+    # same window as incremental_query: the lower and upper bounds apply independently
+    if timestamps and watermark is not None:
+        filters.append("(" + " OR ".join(f"o.{column} > :watermark" for column in timestamps) + ")")
+    if timestamps and until is not None:
+        filters.append(f"GREATEST({', '.join('o.' + column for column in timestamps)}) <= :until")
+
+    query = f"""
+        SELECT DISTINCT ON (o.order_id)
+            {", ".join(select)}
+        FROM {schema}.orders o
+        JOIN {key_map('dim_employees', 'nk_employee_id', 'sk_employee_id')} e ON e.nk_employee_id = o.employee_id
+        JOIN {key_map('dim_customers', 'nk_customer_id', 'sk_customer_id')} c ON c.nk_customer_id = o.customer_id
+        JOIN {schema}.order_details od ON od.order_id = o.order_id
+        JOIN {key_map('dim_products', 'nk_product_id', 'sk_product_id')} p ON p.nk_product_id = od.product_id
+        WHERE {" AND ".join(filters)}
+        ORDER BY o.order_id, od.order_detail_id
+        """
+    return text(query), [column.split(" AS ")[-1].split(".")[-1] for column in select]
+
+
+def transform_order_pushdown(table_name: str, watermark: datetime = None, until: datetime = None, chunksize: int = 50000):
+    """
+    this function runs transform_order as set-based SQL in the warehouse database and yields the final fact rows
+    in chunks of chunksize rows, read through a server-side cursor. Errors are logged and re-raised.
+    """
+    start = stage_start()
+    process = "transformation pushdown"
+    chunk = 0
+    rows = 0
+    nbytes = 0
+    try:
+        with get_engine(warehouse).connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            query, columns = order_pushdown_query(conn, watermark, until)
+            for data in pd.read_sql(sql=query, con=conn, params={"watermark": watermark, "until": until}, chunksize=chunksize):
+                chunk += 1
+                rows += len(data)
+                nbytes += int(data.memory_usage(index=False, deep=True).sum())
+                yield data
+
+        etl_log({
+                "step" : "warehouse",
+                "component": process,
+                "status": "success",
+                "table_name": "order",
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, rows=rows, bytes_moved=nbytes),
+                "chunk": chunk
+                })
+    except Exception as e:
+        etl_log({
+            "step" : "warehouse",
+            "component": process,
+            "status": "failed",
+            "table_name": "order",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start, rows=rows, bytes_moved=nbytes),
+            "chunk": chunk,
+            "error_msg": str(e)
+            })
+        raise
 
-        # get product data from warehouse to merge with order data
-        df_prod = extract_target(table_name='dim_products')
-        df_prod = df_prod[['nk_product_id','sk_product_id']]
 
-        # merging data
-        data = data.merge(df_prod, left_on='product_id', right_on='nk_product_id', how='inner')
+def load_order_pushdown(watermark: datetime = None, until: datetime = None):
+    """
+    this function writes the pushdown fact rows straight into fct_order with INSERT ... SELECT, no rows leave the database.
+    """
+    start = stage_start()
+    try:
+        with get_engine(warehouse).begin() as conn:
+            query, columns = order_pushdown_query(conn, watermark, until)
+            insert = text(f"INSERT INTO public.fct_order ({', '.join(columns)}) SELECT * FROM ({query.text}) AS fact")
+            result = conn.execute(insert, {"watermark": watermark, "until": until})
 
-        # rename column order_id to nk_tracking_id 
-        data = data.rename(columns={'tracking_id':'nk_tracking_id'})
+        log_msg = {
+                "step" : "warehouse",
+                "component": "load pushdown",
+                "status": "success",
+                "table_name": "fct_order",
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                **stage_metrics(start, rows=result.rowcount),
+                "rows": result.rowcount
+            }
+    except Exception as e:
+        log_msg = {
+            "step" : "warehouse",
+            "component": "load pushdown",
+            "status": "failed",
+            "table_name": "fct_order",
+            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+            **stage_metrics(start),
+            "error_msg": str(e)
+        }
+    finally:
+        etl_log(log_msg)
+
+    return log_msg['status'] == 'success'
+
+
+def inventory_rows(data: pd.DataFrame, product_map: pd.Series) -> pd.DataFrame:
+    """
+    this function is the row-local part of transform_inventory_tracking, so it can run on partitions of the rows.
+    """
+    # look up sk_product_id from the cached dim_products key map (inner join)
+    data = data.assign(sk_product_id=data['product_id'].map(product_map))
+    data = data.dropna(subset=['sk_product_id'])
+
+    # rename column order_id to nk_tracking_id 
+    data = data.rename(columns={'tracking_id':'nk_tracking_id'})
+
+    # remove duplicate nk_tracking_id
+    data = data.drop_duplicates(subset=['nk_tracking_id'])
 
-        # remove duplicate nk_tracking_id
-        data = data.drop_duplicates(subset=['nk_tracking_id'])
+    # drop column 
+    return data.drop(columns=['product_id'])
 
-        # change change_date format as integer
-        data['change_date'] = pd.to_datetime(data['change_date'], errors='coerce')
-        data['change_date'] = data['change_date'].dt.strftime('%Y%m%d').astype(int)
+
+def transform_inventory_tracking(data: pd.DataFrame, table_name: str) -> pd.DataFrame:
+    start = stage_start(data)
+    try:
+        process = "transformation"
+
+        # key lookup and dedup, in TRANSFORM_PROCESSES processes on large inputs
+        data = run_partitioned(inventory_rows, data, key='tracking_id', product_map=get_key_map('dim_products'))
+
+        # change change_date format as integer (YYYYMMDD), invalid dates become null
+        data, invalid = coerce_columns(data, column_specs['inventory_tracking'])
 
          # change time created_at
         data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
         
-        # drop column 
-        data = data.drop(columns=['product_id','nk_product_id'])
-        
         log_msg = {
                 "step" : "warehouse",
                 "component": process,
                 "status": "success",
                 "table_name": "inventory_tracking",
-                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current timestamp
+                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                    **stage_metrics(start, data=data),
+                    "invalid_values": sum(invalid.values())
                 }
         
         return data
@@ -312,6 +577,7 @@ def transform_inventory_tracking(data: pd.DataFrame, table_name: str) -> pd.Data
             "status": "failed",
             "table_name": "inventory_tracking",
             "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp,
+            **stage_metrics(start),
             "error_msg": str(e)
             }
         
@@ -0,0 +1,111 @@
+
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from src.utils.config import checkpoint
+
+# Stage outputs of a run are kept as parquet files in <CHECKPOINT_DIR>/<run_id>/<stage>/<table>.parquet,
+# and a <table>.done file marks a stage that completed, so a failed run can be resumed from where it stopped.
+_run = {"run_id": None}
+
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def start_run(run_id: str = None):
+    """
+    this function starts a new run, or resumes run_id when it is given, and returns the run id.
+    """
+    if run_id is not None and not os.path.isdir(os.path.join(checkpoint['dir'], run_id)):
+        raise ValueError(f"no checkpoints found for run {run_id} in {checkpoint['dir']}")
+    _run["run_id"] = run_id or new_run_id()
+    return _run["run_id"]
+
+
+def current_run():
+    return _run["run_id"]
+
+
+def _path(stage: str, table_name: str, suffix: str):
+    return os.path.join(checkpoint['dir'], _run["run_id"], stage, f"{table_name}.{suffix}")
+
+
+def save_frame(stage: str, table_name: str, data: pd.DataFrame, etl_date: datetime = None):
+    """
+    this function persists the output frame of a stage as compressed parquet, with the etl_date the frame was read at.
+    A failure only prints a warning, the run itself doesn't depend on the checkpoint.
+    """
+    if not checkpoint['enabled'] or _run["run_id"] is None or data is None:
+        return
+    # imported here: a run without checkpoints doesn't load pyarrow
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    path = _path(stage, table_name, "parquet")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        if etl_date is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[b"etl_date"] = etl_date.isoformat().encode()
+            table = table.replace_schema_metadata(metadata)
+        # write then rename, so a resumed run never reads a half written file
+        pq.write_table(table, f"{path}.tmp", compression=checkpoint['compression'])
+        os.replace(f"{path}.tmp", path)
+    except Exception as e:
+        print(f"Can't save checkpoint {stage}/{table_name}. Cause: ", str(e))
+
+
+def load_frame(stage: str, table_name: str):
+    """
+    this function returns the saved output frame of a stage of the current run, or None.
+    The etl_date it was saved with is in data.attrs['etl_date'].
+    """
+    if not checkpoint['enabled'] or _run["run_id"] is None:
+        return None
+    path = _path(stage, table_name, "parquet")
+    if not os.path.exists(path):
+        return None
+    import pyarrow.parquet as pq
+    table = pq.read_table(path, memory_map=True)
+    data = table.to_pandas()
+    etl_date = (table.schema.metadata or {}).get(b"etl_date")
+    data.attrs["etl_date"] = datetime.fromisoformat(etl_date.decode()) if etl_date else None
+    return data
+
+
+def mark_done(stage: str, table_name: str):
+    if not checkpoint['enabled'] or _run["run_id"] is None:
+        return
+    path = _path(stage, table_name, "done")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def is_done(stage: str, table_name: str):
+    if not checkpoint['enabled'] or _run["run_id"] is None:
+        return False
+    return os.path.exists(_path(stage, table_name, "done"))
+
+
+def cleanup_runs(retention_days: float = checkpoint['retention_days']):
+    """
+    this function removes the checkpoints of runs older than retention_days (except the current run).
+    """
+    if not os.path.isdir(checkpoint['dir']):
+        return []
+    removed = []
+    limit = time.time() - retention_days * 24 * 3600
+    for run_id in os.listdir(checkpoint['dir']):
+        path = os.path.join(checkpoint['dir'], run_id)
+        if run_id != _run["run_id"] and os.path.isdir(path) and os.path.getmtime(path) < limit:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(run_id)
+    return removed
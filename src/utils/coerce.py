@@ -0,0 +1,69 @@
+
+import numpy as np
+import pandas as pd
+
+# Typed column converters shared by the transforms. Each converter is vectorized and turns invalid values
+# into missing values (NaN/NA/NaT) instead of raising, coerce_columns() counts them for the log.
+
+
+def to_currency(series: pd.Series, signed: bool = False) -> pd.Series:
+    """
+    this function converts currency text like "$1,250.00" to float. "$", "," and "-" are removed, like the
+    previous replace(r'[\\$,\\-]') idiom, signed=True keeps the minus sign.
+    Each distinct text is parsed once, so repeated prices cost one parse.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    codes, uniques = pd.factorize(series)
+    cleaned = pd.Series(uniques.astype(str), dtype=object)
+    for char in ("$", ",") if signed else ("$", ",", "-"):
+        cleaned = cleaned.str.replace(char, "", regex=False)
+    parsed = pd.to_numeric(cleaned, errors="coerce").to_numpy(dtype=float)
+    # code -1 is a missing value
+    values = np.where(codes >= 0, parsed[codes], np.nan)
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def to_timestamp(series: pd.Series) -> pd.Series:
+    """
+    this function parses dates/timestamps to naive datetime64 floored to the second.
+    Timezone aware values are converted to UTC first, invalid values become NaT.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, errors="coerce", utc=True)
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+    return series.dt.floor("s")
+
+
+def to_date_key(series: pd.Series) -> pd.Series:
+    """
+    this function converts dates to the YYYYMMDD integer key of the warehouse (year * 10000 + month * 100 + day),
+    computed from the date parts instead of formatting and parsing a string per row. Invalid dates become NA.
+    """
+    if not pd.api.types.is_datetime64_any_dtype(series):
+        series = pd.to_datetime(series, errors="coerce")
+    key = series.dt.year * 10000 + series.dt.month * 100 + series.dt.day
+    return key.astype("Int64")
+
+
+converters = {
+    "currency": to_currency,
+    "timestamp": to_timestamp,
+    "date_key": to_date_key,
+}
+
+
+def coerce_columns(data: pd.DataFrame, specs: dict):
+    """
+    this function applies the converters declared in specs ({column: converter name}) to data.
+    It returns the converted frame and the number of values per column that became missing because they were invalid.
+    """
+    invalid = {}
+    for column, kind in specs.items():
+        if column not in data.columns:
+            continue
+        was_missing = data[column].isna()
+        data[column] = converters[kind](data[column])
+        invalid[column] = int((data[column].isna() & ~was_missing).sum())
+    return data, invalid
@@ -41,10 +41,119 @@ log = {
 
 minio ={
     "access_key" : os.getenv("MINIO_ACCESS_KEY"),
-    "secret_key" : os.getenv("MINIO_SECRET_KEY")
+    "secret_key" : os.getenv("MINIO_SECRET_KEY"),
+    "endpoint" : os.getenv("MINIO_ENDPOINT", "localhost:9000"),
+    "secure" : os.getenv("MINIO_SECURE", "false").lower() == "true"
 }
 
 sheets = {
 "cred_path": os.getenv("CRED_PATH"),
-"key_spreadsheet": os.getenv("KEY_SPREADSHEET")
-}
\ No newline at end of file
+"key_spreadsheet": os.getenv("KEY_SPREADSHEET"),
+"worksheets": [name for name in os.getenv("WORKSHEETS", "store_branch").split(",") if name],
+"conditional": os.getenv("SHEETS_CONDITIONAL", "true").lower() == "true",
+"snapshot_dir": os.getenv("SHEETS_SNAPSHOT_DIR", ".sheets_snapshot")
+}
+
+pool = {
+"size": int(os.getenv("POOL_SIZE", 5)),
+"max_overflow": int(os.getenv("POOL_MAX_OVERFLOW", 5)),
+"timeout": int(os.getenv("POOL_TIMEOUT", 30)),
+"recycle": int(os.getenv("POOL_RECYCLE", 1800)),
+"pre_ping": os.getenv("POOL_PRE_PING", "true").lower() == "true"
+}
+
+extract = {
+"chunksize": int(os.getenv("EXTRACT_CHUNKSIZE", 50000)),
+"stream_tables": [table for table in os.getenv("STREAM_TABLES", "").split(",") if table],
+# per table chunk size, set by the planner
+"table_chunksize": {}
+}
+
+incremental = {
+"enabled": os.getenv("INCREMENTAL", "false").lower() == "true",
+"full_refresh": [table for table in os.getenv("FULL_REFRESH_TABLES", "").split(",") if table]
+}
+
+load = {
+"method": os.getenv("WH_LOAD_METHOD", "copy"),
+"staging_method": os.getenv("STG_LOAD_METHOD", "copy"),
+"copy_batch_rows": int(os.getenv("COPY_BATCH_ROWS", 100000))
+}
+
+parallel = {
+"staging_workers": int(os.getenv("STAGING_WORKERS", 4)),
+"warehouse_workers": int(os.getenv("WAREHOUSE_WORKERS", 3)),
+"transform_processes": int(os.getenv("TRANSFORM_PROCESSES", 1)),
+"transform_min_rows": int(os.getenv("TRANSFORM_MIN_ROWS", 200000))
+}
+
+pushdown = {
+"enabled": os.getenv("ORDER_PUSHDOWN", "false").lower() == "true",
+"write": os.getenv("ORDER_PUSHDOWN_WRITE", "false").lower() == "true",
+"staging_schema": os.getenv("PUSHDOWN_STAGING_SCHEMA", "staging")
+}
+
+log_sink = {
+"batch_size": int(os.getenv("LOG_BATCH_SIZE", 200)),
+"flush_interval": float(os.getenv("LOG_FLUSH_INTERVAL", 5)),
+"spill_path": os.getenv("LOG_SPILL_PATH", "etl_log_spill.jsonl")
+}
+
+metrics = {
+"textfile": os.getenv("METRICS_TEXTFILE"),
+"openmetrics": os.getenv("METRICS_FORMAT", "prometheus").lower() == "openmetrics"
+}
+
+handoff = {
+"enabled": os.getenv("STAGING_HANDOFF", "true").lower() == "true"
+}
+
+checkpoint = {
+"enabled": os.getenv("CHECKPOINTS", "true").lower() == "true",
+"dir": os.getenv("CHECKPOINT_DIR", ".checkpoints"),
+"retention_days": float(os.getenv("CHECKPOINT_RETENTION_DAYS", 7)),
+"compression": os.getenv("CHECKPOINT_COMPRESSION", "zstd")
+}
+
+dtypes = {
+"enabled": os.getenv("DTYPE_PLANS", "true").lower() == "true",
+"arrow_strings": os.getenv("DTYPE_ARROW_STRINGS", "false").lower() == "true",
+"downcast_floats": os.getenv("DTYPE_DOWNCAST_FLOATS", "false").lower() == "true"
+}
+
+change_detection = {
+"enabled": os.getenv("CHANGE_DETECTION", "false").lower() == "true",
+"table": os.getenv("ROW_HASH_TABLE", "etl_row_hash")
+}
+
+partitions = {
+"enabled": os.getenv("FACT_PARTITIONS", "false").lower() == "true"
+}
+
+quarantine = {
+"backend": os.getenv("QUARANTINE_BACKEND", "minio"),
+"local_dir": os.getenv("QUARANTINE_DIR", "quarantine"),
+"compression": os.getenv("QUARANTINE_COMPRESSION", "zstd")
+}
+
+validation = {
+"enabled": os.getenv("VALIDATION", "true").lower() == "true",
+"bucket": os.getenv("VALIDATION_BUCKET", "minio-container")
+}
+
+stream_join = {
+"enabled": os.getenv("ORDER_STREAM_JOIN", "false").lower() == "true",
+"chunksize": int(os.getenv("ORDER_STREAM_CHUNKSIZE", 100000))
+}
+
+fact_stream = {
+# fact targets loaded in chunks of staging rows (row-local transforms only: fct_inventory)
+"targets": [table for table in os.getenv("FACT_STREAM_TARGETS", "").split(",") if table],
+"chunksize": int(os.getenv("FACT_STREAM_CHUNKSIZE", 100000))
+}
+
+planner = {
+"enabled": os.getenv("PLANNER", "false").lower() == "true",
+"memory_budget_mb": float(os.getenv("MEMORY_BUDGET_MB", 2048)),
+"memory_factor": float(os.getenv("PLANNER_MEMORY_FACTOR", 3))
+}
@@ -0,0 +1,80 @@
+
+import threading
+
+import pandas as pd
+
+from src.utils.config import dtypes
+
+# Low cardinality text columns stored as categoricals, per table (staging and warehouse names).
+# Email columns are unique per row, so they stay plain strings.
+dtype_plans = {
+    "employees": {"category": ["role"]},
+    "products": {"category": ["category", "store_branch"]},
+    "orders": {"category": ["payment_method", "order_status"]},
+    "inventory_tracking": {"category": ["reason"]},
+    "store_branch": {"category": ["city"]},
+    "dim_employees": {"category": ["role"]},
+    "dim_products": {"category": ["category"]},
+    "dim_store_branch": {"category": ["city"]},
+    "fct_order": {"category": ["payment_method", "order_status"]},
+    "fct_inventory": {"category": ["reason"]},
+}
+
+# a categorical only saves memory when values repeat
+MAX_CATEGORY_RATIO = 0.5
+
+_report = {}
+_lock = threading.Lock()
+
+
+def is_key(column: str):
+    # natural/surrogate keys keep int64 so map lookups and merges compare the same dtype on both sides
+    return column.endswith("_id") or column.startswith(("nk_", "sk_"))
+
+
+def apply_dtype_plan(df: pd.DataFrame, table_name: str, step: str) -> pd.DataFrame:
+    """
+    this function shrinks an extracted frame in place: planned text columns become categoricals, non key integers are
+    downcast, and optionally (DTYPE_DOWNCAST_FLOATS, DTYPE_ARROW_STRINGS) floats are downcast and the remaining text
+    columns use the pyarrow string dtype. The memory before and after is kept for dtype_report().
+    """
+    if not dtypes['enabled'] or df is None or df.empty:
+        return df
+
+    bytes_before = int(df.memory_usage(index=False, deep=True).sum())
+    plan = dtype_plans.get(table_name, {})
+
+    for column in plan.get("category", []):
+        if column in df.columns and df[column].nunique() <= MAX_CATEGORY_RATIO * len(df):
+            df[column] = df[column].astype("category")
+
+    for column in df.columns:
+        if is_key(column):
+            continue
+        if pd.api.types.is_integer_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+        elif dtypes['downcast_floats'] and pd.api.types.is_float_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast="float")
+        elif dtypes['arrow_strings'] and df[column].dtype == object and pd.api.types.infer_dtype(df[column]) == "string":
+            df[column] = df[column].astype("string[pyarrow]")
+
+    bytes_after = int(df.memory_usage(index=False, deep=True).sum())
+    with _lock:
+        report = _report.setdefault((step, table_name), {"rows": 0, "bytes_before": 0, "bytes_after": 0})
+        report["rows"] += len(df)
+        report["bytes_before"] += bytes_before
+        report["bytes_after"] += bytes_after
+    return df
+
+
+def dtype_report():
+    """
+    this function returns the rows and memory before/after the dtype plan of every (step, table) read in this run.
+    """
+    with _lock:
+        return [{"step": step, "table_name": table_name, **report} for (step, table_name), report in _report.items()]
+
+
+def clear_dtype_report():
+    with _lock:
+        _report.clear()
@@ -0,0 +1,121 @@
+
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+from src.utils.config import pool
+
+# one engine (and connection pool) per database for the whole process
+_engines = {}
+_stats = {}
+_lock = threading.Lock()
+# the counters are updated by every thread that checks out a connection
+_stats_lock = threading.Lock()
+# checkout in progress in this thread: time spent opening new connections during it
+_checkout = threading.local()
+
+
+def _count(key, **amounts):
+    with _stats_lock:
+        stats = _stats.get(key)
+        if stats is not None:
+            for name, amount in amounts.items():
+                stats[name] += amount
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that records how long each checkout waited for a free connection, apart from the time spent
+    opening a new connection (connect_s), so a saturated pool can be told from a slow database connect.
+    """
+    def _do_get(self):
+        # QueuePool._do_get calls itself again after a race, only the outer call is timed
+        if getattr(_checkout, "active", False):
+            return super()._do_get()
+        _checkout.active = True
+        _checkout.connect_s = 0.0
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _checkout.active = False
+            _count(self._stats_key, checkout_wait_s=time.perf_counter() - start - _checkout.connect_s,
+                   connect_s=_checkout.connect_s)
+
+    def _create_connection(self):
+        start = time.perf_counter()
+        try:
+            return super()._create_connection()
+        finally:
+            if getattr(_checkout, "active", False):
+                _checkout.connect_s += time.perf_counter() - start
+            else:
+                _count(self._stats_key, connect_s=time.perf_counter() - start)
+
+    def recreate(self):
+        new_pool = super().recreate()
+        new_pool._stats_key = self._stats_key
+        return new_pool
+
+
+def _engine_key(db: dict):
+    return (db['user'], db['host'], db['port'], db['db'])
+
+
+def get_engine(db: dict):
+    """
+    this function returns the shared engine for a database config (source, staging, warehouse, log),
+    creating it with the configured pool settings on first use.
+    """
+    key = _engine_key(db)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+
+    with _lock:
+        if key not in _engines:
+            engine = create_engine(f"postgresql+psycopg2://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['db']}",
+                                   poolclass=TimedQueuePool,
+                                   pool_size=pool['size'],
+                                   max_overflow=pool['max_overflow'],
+                                   pool_timeout=pool['timeout'],
+                                   pool_recycle=pool['recycle'],
+                                   pool_pre_ping=pool['pre_ping'])
+            engine.pool._stats_key = key
+            with _stats_lock:
+                _stats[key] = {"database": db['db'], "connections": 0, "checkouts": 0, "checkout_wait_s": 0.0,
+                               "connect_s": 0.0}
+
+            # count new DB connections (handshakes) and pool checkouts
+            @event.listens_for(engine, "connect")
+            def on_connect(dbapi_conn, conn_record):
+                _count(key, connections=1)
+
+            @event.listens_for(engine, "checkout")
+            def on_checkout(dbapi_conn, conn_record, conn_proxy):
+                _count(key, checkouts=1)
+
+            _engines[key] = engine
+        return _engines[key]
+
+
+def engine_stats():
+    """
+    this function returns the connection counts, total checkout wait time and connect time of every engine in this run.
+    """
+    with _stats_lock:
+        return [dict(stats) for stats in _stats.values()]
+
+
+def dispose_engines():
+    """
+    this function closes every pooled connection and clears the registry and its stats.
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        with _stats_lock:
+            _stats.clear()
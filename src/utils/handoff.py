@@ -0,0 +1,32 @@
+
+import threading
+
+from src.utils.config import handoff
+
+# frames fully loaded into staging during this run, reused by the warehouse phase instead of reading staging back
+_frames = {}
+_lock = threading.Lock()
+
+
+def put_frame(table_name: str, data):
+    """
+    this function keeps the frame that was just upserted into staging for the warehouse phase of this run.
+    Only call it for full loads of a table: the frame must be the whole table, not a chunk or an incremental delta.
+    """
+    if not handoff['enabled'] or data is None:
+        return
+    with _lock:
+        _frames[table_name] = data
+
+
+def take_frame(table_name: str):
+    """
+    this function returns (and forgets) the staged frame of a table, or None when it has to be read from staging.
+    """
+    with _lock:
+        return _frames.pop(table_name, None)
+
+
+def clear_frames():
+    with _lock:
+        _frames.clear()
@@ -1,12 +1,17 @@
 
-from src.utils.config import  log
-from sqlalchemy import create_engine
-from minio import Minio
-from io import BytesIO
+from src.utils.config import  log, log_sink
+from src.utils.engine import get_engine
+from src.utils.metrics import record_stage
+from src.utils.quarantine import quarantine_frame
+from sqlalchemy import inspect, text, Integer
+from io import StringIO
 import pandas as pd
 from datetime import datetime
+import threading
+import atexit
+import json
+import os
 
-from src.utils.config import minio 
 
 #list table 
 def list_tables (db: dict):
@@ -15,30 +20,162 @@ def list_tables (db: dict):
         FROM information_schema.tables
         WHERE table_schema = 'public';
     """
-    conn = create_engine(f"postgresql+psycopg2://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['db']}")
+    conn = get_engine(db)
     table_list = pd.read_sql(query, conn)
     return table_list
 
 
 
 # Logging 
+_log_columns = set()
+_log_buffer = []
+_log_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_flush_event = threading.Event()
+_flush_thread = None
+
+def ensure_log_columns(conn, log_msg: dict):
+    """
+    this function adds any log_msg key that is not yet a column of etl_log (e.g. chunk progress), so new log fields don't break old log tables.
+    """
+    if set(log_msg) <= _log_columns:
+        return
+
+    inspector = inspect(conn)
+    if not inspector.has_table("etl_log"):
+        # to_sql will create the table from the first message
+        return
+    _log_columns.update(column['name'] for column in inspector.get_columns("etl_log"))
+
+    with conn.begin() as connection:
+        for key, value in log_msg.items():
+            if key in _log_columns:
+                continue
+            if isinstance(value, bool):
+                column_type = "BOOLEAN"
+            elif isinstance(value, int):
+                column_type = "BIGINT"
+            elif isinstance(value, float):
+                column_type = "DOUBLE PRECISION"
+            else:
+                column_type = "TEXT"
+            connection.execute(text(f'ALTER TABLE etl_log ADD COLUMN IF NOT EXISTS "{key}" {column_type}'))
+            _log_columns.add(key)
+
+
+def write_log_rows(rows: list):
+    # one bulk insert for a batch of log messages
+    conn = get_engine(log)
+
+    # first value of each key decides the type of a new column, keys that are always empty are left out
+    sample = {}
+    for row in rows:
+        for key, value in row.items():
+            if value is not None and key not in sample:
+                sample[key] = value
+    ensure_log_columns(conn, sample)
+
+    df_log = pd.DataFrame(rows)[list(sample)]
+    df_log.to_sql(name = "etl_log",  # Your log table
+                    con = conn,
+                    if_exists = "append",
+                    index = False,
+                    method = "multi",
+                    chunksize = 1000
+                    )
+
+
+def spill_log_rows(rows: list):
+    # log database unreachable: keep the messages in a local file, they are sent with the next successful flush
+    with open(log_sink['spill_path'], "a") as file:
+        for row in rows:
+            file.write(json.dumps(row, default=str) + "\n")
+
+
+def read_spilled_rows():
+    # messages of earlier failed flushes; a corrupt or half-written line is skipped (kept in <spill>.bad)
+    if not os.path.exists(log_sink['spill_path']):
+        return []
+    rows, bad = [], []
+    with open(log_sink['spill_path']) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                bad.append(line if line.endswith("\n") else line + "\n")
+    if bad:
+        print(f"Skipped {len(bad)} unreadable line(s) of {log_sink['spill_path']}")
+        with open(f"{log_sink['spill_path']}.bad", "a") as file:
+            file.writelines(bad)
+        # the spill file keeps only the readable messages, so a bad line is moved once
+        with open(f"{log_sink['spill_path']}.tmp", "w") as file:
+            file.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+        os.replace(f"{log_sink['spill_path']}.tmp", log_sink['spill_path'])
+    return rows
+
+
+def flush_etl_log():
+    """
+    this function writes every buffered log message to etl_log in bulk, plus messages spilled by earlier failed flushes.
+    If the log database can't be reached the messages are spilled to LOG_SPILL_PATH instead.
+    """
+    with _flush_lock:
+        with _log_lock:
+            rows = _log_buffer[:]
+            _log_buffer.clear()
+
+        spilled = []
+        try:
+            spilled = read_spilled_rows()
+            if not rows and not spilled:
+                return
+            write_log_rows(spilled + rows)
+            if spilled:
+                os.remove(log_sink['spill_path'])
+        except Exception as e:
+            print("Can't save your log message. Cause: ", str(e))
+            spill_log_rows(rows)
+
+
+def _flush_loop():
+    # background flusher: every flush_interval seconds or as soon as a batch is full
+    while True:
+        _flush_event.wait(timeout=log_sink['flush_interval'])
+        _flush_event.clear()
+        try:
+            flush_etl_log()
+        except Exception as e:
+            # keep the flusher alive, the buffer is written by the next flush
+            print("Can't flush your log messages. Cause: ", str(e))
+
+
+def close_etl_log():
+    # called at process exit so no buffered message is lost
+    flush_etl_log()
+
+
 def etl_log(log_msg: dict):
+    """
+    this function buffers a log message, a background thread writes the buffer to etl_log in batches.
+    """
+    global _flush_thread
 
-    try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{log['user']}:{log['password']}@{log['host']}:{log['port']}/{log['db']}")
-        
-        # convert dictionary to dataframe
-        df_log = pd.DataFrame([log_msg])
-
-        #extract data log
-        df_log.to_sql(name = "etl_log",  # Your log table
-                        con = conn,
-                        if_exists = "append",
-                        index = False,
-                        )
-    except Exception as e:
-        print("Can't save your log message. Cause: ", str(e))
+    # stage performance fields also go to the metrics textfile
+    record_stage(log_msg)
+
+    with _log_lock:
+        _log_buffer.append(dict(log_msg))
+        full = len(_log_buffer) >= log_sink['batch_size']
+
+        if _flush_thread is None:
+            _flush_thread = threading.Thread(target=_flush_loop, name="etl-log-flush", daemon=True)
+            _flush_thread.start()
+            atexit.register(close_etl_log)
+
+    if full:
+        _flush_event.set()
 
 
 def read_etl_log(filter_params: dict):
@@ -46,22 +183,25 @@ def read_etl_log(filter_params: dict):
     function read_etl_log that reads log information from the etl_log table and extracts the maximum etl_date for a specific process, step, table name, and status.
     """
     try:
-        # create connection to database
-        conn = create_engine(f"postgresql+psycopg2://{log['user']}:{log['password']}@{log['host']}:{log['port']}/{log['db']}")
+        # buffered messages (e.g. a watermark just committed) must be in the table before reading it
+        flush_etl_log()
+
+        # get pooled connection to database
+        conn = get_engine(log)
         
         # To help with the incremental process, get the etl_date from the relevant process
-        query = """
-            SELECT MAX(etl_date)
+        query = text("""
+            SELECT MAX(etl_date) AS max
             FROM etl_log
             WHERE 
-                step = %s AND
-                table_name ILIKE %s AND
-                status = %s AND
-                component = %s    
-            """
+                step = :step AND
+                table_name ILIKE :table_name AND
+                status = :status AND
+                component = :component    
+            """)
         
         # Execute the query with pd.read_sql
-        df = pd.read_sql(sql=query, con=conn, params=(filter_params,))
+        df = pd.read_sql(sql=query, con=conn, params=filter_params)
 
         #return extracted data
         return df
@@ -70,34 +210,151 @@ def read_etl_log(filter_params: dict):
 
 
 
-def handle_error(data, bucket_name:str, table_name:str):
+# Bulk load
+def cast_integer_columns(connection, data: pd.DataFrame, table_name: str, schema: str = 'public') -> pd.DataFrame:
+    # float columns (ints with missing values) would be written as 1.0, which COPY rejects for integer columns
+    integer_columns = [column['name'] for column in inspect(connection).get_columns(table_name, schema=schema)
+                       if isinstance(column['type'], Integer)]
+    for column in data.columns:
+        if column in integer_columns and data[column].dtype.kind == 'f':
+            data = data.assign(**{column: data[column].astype('Int64')})
+    return data
 
-    current_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    # Initialize MinIO client
-    client = Minio('localhost:9000',
-                access_key=minio['access_key'],
-                secret_key=minio['secret_key'],
-                secure=False)
-
-    # Make a bucket if it doesn't exist
-    if not client.bucket_exists(bucket_name):
-        client.make_bucket(bucket_name)
-
-    # Convert DataFrame to CSV and then to bytes
-    csv_bytes = data.to_csv().encode('utf-8')
-    csv_buffer = BytesIO(csv_bytes)
-
-    # Upload the CSV file to the bucket
-    client.put_object(
-        bucket_name=bucket_name,
-        object_name=f"{table_name}_{current_date}.csv", #name the fail source name and current etl date
-        data=csv_buffer,
-        length=len(csv_bytes),
-        content_type='application/csv'
-    )
-
-    # List objects in the bucket
-    objects = client.list_objects(bucket_name, recursive=True)
-    for obj in objects:
-        print(obj.object_name)
 
+def copy_dataframe(connection, data: pd.DataFrame, table_name: str, schema: str = 'public', batch_rows: int = 100000,
+                   cast: bool = True):
+    """
+    this function streams a dataframe into a table with COPY FROM STDIN (csv), batch_rows rows per COPY,
+    on the given connection so the caller controls the transaction.
+    With cast=False the integer columns are expected to be cast already (cast_integer_columns).
+    """
+    if cast:
+        data = cast_integer_columns(connection, data, table_name, schema)
+
+    columns = ", ".join(f'"{column}"' for column in data.columns)
+    query = f"COPY {schema}.{table_name} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+
+    cursor = connection.connection.cursor()
+    try:
+        for start in range(0, len(data), batch_rows):
+            # missing values are written as \N so empty strings stay ''
+            buffer = StringIO()
+            data.iloc[start:start + batch_rows].to_csv(buffer, index=False, header=False, na_rep='\\N')
+            buffer.seek(0)
+            cursor.copy_expert(query, buffer)
+    finally:
+        cursor.close()
+
+
+def upsert_dataframe(connection, data: pd.DataFrame, table_name: str, pk: list, schema: str = 'public',
+                     batch_rows: int = 100000):
+    """
+    this function upserts a dataframe in one statement: the rows are copied into a temp table (dropped on commit),
+    then INSERT ... ON CONFLICT (pk) DO UPDATE writes them into the table. Rows equal to the existing row are not
+    rewritten. It returns the number of inserted and updated rows.
+    """
+    if not pk:
+        raise ValueError(f"{schema}.{table_name} has no primary key to upsert on")
+
+    # a key can be written once per statement, the last row of a key wins
+    data = data.drop_duplicates(subset=pk, keep='last')
+    data = cast_integer_columns(connection, data, table_name, schema)
+
+    temp_table = f"tmp_{table_name}"
+    connection.exec_driver_sql(f"CREATE TEMP TABLE {temp_table} (LIKE {schema}.{table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+    copy_dataframe(connection, data, table_name=temp_table, schema='pg_temp', batch_rows=batch_rows, cast=False)
+
+    columns = [f'"{column}"' for column in data.columns]
+    keys = [f'"{column}"' for column in pk]
+    values = [column for column in columns if column not in keys]
+    if values:
+        conflict = (f"DO UPDATE SET {', '.join(f'{column} = EXCLUDED.{column}' for column in values)} "
+                    f"WHERE ({', '.join(f't.{column}' for column in values)}) "
+                    f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in values)})")
+    else:
+        conflict = "DO NOTHING"
+
+    # xmax = 0: the row version was inserted by this statement, not updated
+    result = connection.exec_driver_sql(f"""
+        WITH upsert AS (
+            INSERT INTO {schema}.{table_name} AS t ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM pg_temp.{temp_table}
+            ON CONFLICT ({', '.join(keys)}) {conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upsert
+    """).one()
+    return result[0], result[1]
+
+
+# Incremental
+def get_watermark(step: str, table_name: str):
+    """
+    this function returns the last committed watermark (etl_date) of a table for a step, or None when the table has never been loaded.
+    """
+    df = read_etl_log({
+            "step": step,
+            "table_name": table_name,
+            "status": "success",
+            "component": "watermark"
+        })
+    if df is None or df.empty or pd.isna(df['max'][0]):
+        return None
+    return pd.Timestamp(df['max'][0]).to_pydatetime()
+
+
+def source_clock(db: dict) -> datetime:
+    """
+    this function returns the watermark of an extraction read from the source database clock (not the pipeline host):
+    now(), or the start of the oldest transaction still open when it is earlier, since the rows of that transaction
+    get a created_at/updated_at before they are committed and visible.
+    """
+    query = text("""
+        SELECT LEAST(now(), (SELECT min(xact_start) FROM pg_stat_activity
+                             WHERE datname = current_database() AND pid <> pg_backend_pid()))::timestamp
+    """)
+    with get_engine(db).connect() as conn:
+        return conn.execute(query).scalar()
+
+
+def commit_watermark(step: str, table_name: str, etl_date: datetime):
+    """
+    this function saves a new watermark for a table, call it only after the load succeeded.
+    """
+    etl_log({
+            "step" : step,
+            "component": "watermark",
+            "status": "success",
+            "table_name": table_name,
+            "etl_date": etl_date.strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+
+def incremental_query(conn, table_name: str, watermark: datetime = None, until: datetime = None):
+    """
+    this function builds the extraction query of a table, filtered on created_at/updated_at when a watermark is given
+    (rows changed after :watermark, and not after :until when it is given).
+    """
+    query = f"""
+        SELECT * 
+        FROM {table_name} 
+        """
+    if watermark is None and until is None:
+        return text(query)
+
+    columns = [column['name'] for column in inspect(conn).get_columns(table_name)]
+    timestamps = [column for column in ('created_at', 'updated_at') if column in columns]
+    filters = []
+    if timestamps and watermark is not None:
+        filters.append("(" + " OR ".join(f"{column} > :watermark" for column in timestamps) + ")")
+    if timestamps and until is not None:
+        # rows changed after :until are left for the next window
+        filters.append(f"GREATEST({', '.join(timestamps)}) <= :until")
+    if filters:
+        query += "WHERE " + " AND ".join(filters)
+    return text(query)
+
+
+def handle_error(data, bucket_name:str, table_name:str):
+    # quarantine the failed data, written to Object Storage by a background worker
+    quarantine_frame(data, table_name=table_name, bucket_name=bucket_name)
@@ -0,0 +1,110 @@
+
+import os
+import resource
+import threading
+import time
+from datetime import datetime
+
+from src.utils.config import metrics
+
+# per-stage samples of this run, exported as a Prometheus/OpenMetrics textfile
+_samples = []
+_lock = threading.Lock()
+
+METRICS = {
+    "duration_s": ("etl_stage_duration_seconds", "Wall time of the stage"),
+    "rows_in": ("etl_stage_rows_in", "Rows received by the stage"),
+    "rows_out": ("etl_stage_rows_out", "Rows produced or written by the stage"),
+    "bytes_moved": ("etl_stage_bytes", "In-memory size of the frame produced or written by the stage"),
+    "mem_delta_mb": ("etl_stage_peak_memory_delta_megabytes",
+                     "Growth of the process-wide peak RSS (high-water mark) during the stage, includes concurrent stages"),
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_start(data=None) -> dict:
+    """
+    this function marks the start of a stage (time, peak memory and input rows).
+    """
+    return {
+        "start_time": datetime.now(),
+        "perf": time.perf_counter(),
+        "peak_rss_mb": _peak_rss_mb(),
+        "rows_in": len(data) if data is not None else None,
+    }
+
+
+def stage_metrics(start: dict, data=None, rows: int = None, bytes_moved: int = None) -> dict:
+    """
+    this function returns the performance fields of a stage for its log_msg:
+    start/end time, duration, input/output rows, bytes of the output frame and peak memory delta.
+    Chunked stages pass their total rows and bytes instead of a frame.
+    mem_delta_mb is the growth of the process-wide high-water mark (ru_maxrss), not the memory of the stage:
+    it includes the allocations of stages running concurrently in other threads, and it is 0 when an earlier
+    stage already reached a higher peak.
+    """
+    if data is not None:
+        rows = len(data)
+        bytes_moved = int(data.memory_usage(index=False, deep=True).sum())
+    return {
+        "start_time": start["start_time"].strftime("%Y-%m-%d %H:%M:%S.%f"),
+        "end_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),
+        "duration_s": round(time.perf_counter() - start["perf"], 4),
+        "rows_in": start["rows_in"],
+        "rows_out": rows,
+        "bytes_moved": bytes_moved,
+        "mem_delta_mb": round(_peak_rss_mb() - start["peak_rss_mb"], 2),
+    }
+
+
+def record_stage(log_msg: dict):
+    # keep the stage sample for the metrics textfile
+    if "duration_s" not in log_msg:
+        return
+    with _lock:
+        _samples.append(dict(log_msg))
+
+
+def _labels(sample: dict):
+    labels = []
+    for key in ("step", "component", "table_name", "status"):
+        value = str(sample.get(key) or "").replace('"', "'")
+        labels.append(f'{key}="{value}"')
+    return ",".join(labels)
+
+
+def write_metrics(path: str = metrics['textfile'], openmetrics: bool = metrics['openmetrics']):
+    """
+    this function writes the stage samples of this run to a textfile in Prometheus (node_exporter textfile collector)
+    or OpenMetrics format. The file is replaced atomically.
+    """
+    if not path:
+        return
+    # one series per stage/table/status, the latest sample wins
+    with _lock:
+        series = {_labels(sample): sample for sample in _samples}
+
+    lines = []
+    for field, (name, description) in METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, sample in series.items():
+            if sample.get(field) is not None:
+                lines.append(f"{name}{{{labels}}} {sample[field]}")
+    if openmetrics:
+        lines.append("# EOF")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    # rename so the collector never reads a half written file
+    os.replace(tmp_path, path)
+
+
+def clear_metrics():
+    with _lock:
+        _samples.clear()
@@ -0,0 +1,79 @@
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.utils.config import parallel
+
+# Partitioned execution of a transform in a process pool. The pipeline calls it from the warehouse DAG threads
+# while the log and quarantine threads run, so the workers are not forked from this process (a fork of a
+# multithreaded process can deadlock): they come from a forkserver (spawn where there is none).
+# The input and the frames joined to it (order_details) are hash partitioned by the same key and each worker
+# gets only its slices; the read-only arguments (the dimension key maps) are sent once to each worker by its
+# initializer. Only the output of each partition comes back.
+POSITION = "_position"
+
+_worker = {}
+
+
+def _context():
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _partitions(keys: pd.Series, processes: int) -> np.ndarray:
+    # partition of each key, the same for a key in any frame: numeric keys are hashed as float64 whatever
+    # their dtype (int32, int64, Int64) so orders and order_details agree
+    if pd.api.types.is_numeric_dtype(keys):
+        keys = keys.astype("float64")
+    return (pd.util.hash_pandas_object(keys, index=False).to_numpy() % processes).astype(int)
+
+
+def _init_worker(func, kwargs: dict):
+    _worker["job"] = (func, kwargs)
+
+
+def _run_partition(partition: tuple):
+    data, frames = partition
+    func, kwargs = _worker["job"]
+    return func(data, **frames, **kwargs)
+
+
+def run_partitioned(func, data: pd.DataFrame, key: str, processes: int = None, min_rows: int = None,
+                    partitioned: dict = None, **kwargs) -> pd.DataFrame:
+    """
+    this function returns func(data, **partitioned frames, **kwargs), computed on `processes` hash partitions of
+    data by `key` in a process pool when data has at least min_rows rows. `partitioned` maps an argument of func
+    to (frame, column): the frame is partitioned by that column like data, so a worker joins only its slice.
+    func must be a module level function (it is pickled), row-local for a key (every row of a key is in the same
+    partition) and have no side effects. The output has the rows in the same order as a single call.
+    """
+    # defaults read at call time, the planner may have set them
+    processes = parallel['transform_processes'] if processes is None else processes
+    min_rows = parallel['transform_min_rows'] if min_rows is None else min_rows
+    partitioned = partitioned or {}
+    if processes <= 1 or len(data) < min_rows:
+        frames = {name: frame for name, (frame, column) in partitioned.items()}
+        return func(data, **frames, **kwargs).reset_index(drop=True)
+
+    data = data.assign(**{POSITION: np.arange(len(data))})
+    partitions = _partitions(data[key], processes)
+    frame_partitions = {name: (frame, _partitions(frame[column], processes))
+                        for name, (frame, column) in partitioned.items()}
+    jobs = [(data[partitions == partition],
+             {name: frame[parts == partition] for name, (frame, parts) in frame_partitions.items()})
+            for partition in range(processes)]
+
+    context = _context()
+    if context.get_start_method() == "forkserver":
+        # the server imports the transform module once, the workers forked from it don't
+        context.set_forkserver_preload([func.__module__])
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context,
+                             initializer=_init_worker, initargs=(func, kwargs)) as pool:
+        outputs = list(pool.map(_run_partition, jobs))
+
+    # back in the order of the input rows
+    output = pd.concat(outputs).sort_values(POSITION, kind="stable")
+    return output.drop(columns=[POSITION]).reset_index(drop=True)
@@ -0,0 +1,257 @@
+
+import copy
+import os
+
+from sqlalchemy import text
+
+from src.utils.engine import get_engine
+from src.utils.config import source, extract, parallel, stream_join, fact_stream, handoff, planner
+from src.integration.warehouse.transform import order_pushdown_enabled
+
+# Run planner: from the table statistics of the source database it picks, under MEMORY_BUDGET_MB,
+# the streaming or in-memory path and chunk size of each table and the number of workers of each phase.
+MIN_CHUNKSIZE = 10_000
+MAX_CHUNKSIZE = 1_000_000
+# row size assumed for a table never analyzed
+DEFAULT_ROW_BYTES = 100
+
+# configuration changed by apply_plan
+_planned = [extract, parallel, handoff, stream_join, fact_stream]
+
+# staging tables read by each warehouse task
+task_inputs = {
+    "dim_customers": ["customers"],
+    "dim_employees": ["employees"],
+    "dim_store_branch": ["store_branch"],
+    "dim_products": ["products"],
+    "fct_order": ["orders", "order_details"],
+    "fct_inventory": ["inventory_tracking"],
+}
+
+# dimension key maps of each fact transform, sent whole to every transform process
+task_key_maps = {
+    "fct_order": ["dim_employees", "dim_customers", "dim_products"],
+    "fct_inventory": ["dim_products"],
+}
+# size of a key map entry (natural key and surrogate key uuid string)
+KEY_MAP_ROW_BYTES = 100
+
+
+def table_stats(db: dict, tables: list) -> dict:
+    """
+    this function returns {table: {"rows", "bytes"}} from pg_class.reltuples and pg_total_relation_size.
+    Tables that are not in the database (the spreadsheet) have 0 rows, a table never analyzed gets its rows
+    from its size.
+    """
+    query = text("""
+        SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND c.relname = ANY(:tables)
+    """)
+    with get_engine(db).connect() as conn:
+        found = {name: (rows, size) for name, rows, size in conn.execute(query, {"tables": list(tables)})}
+
+    stats = {}
+    for table_name in tables:
+        rows, size = found.get(table_name, (0, 0))
+        if rows <= 0 and size > 0:
+            # reltuples is -1 (or 0 before PostgreSQL 14) until the first VACUUM/ANALYZE
+            rows = size // DEFAULT_ROW_BYTES
+        stats[table_name] = {"rows": int(rows), "bytes": int(size)}
+    return stats
+
+
+def _memory(stats: dict) -> float:
+    # estimated size of the table as a pandas frame
+    return stats["bytes"] * planner['memory_factor']
+
+
+def _chunksize(stats: dict, memory: float) -> int:
+    # rows of a chunk that fits in `memory` bytes
+    row_bytes = _memory(stats) / stats["rows"] if stats["rows"] else DEFAULT_ROW_BYTES
+    return int(min(max(memory // row_bytes, MIN_CHUNKSIZE), MAX_CHUNKSIZE))
+
+
+def _key_maps(target_table: str, stats: dict) -> float:
+    # estimated size of the key maps of a fact transform
+    rows = sum(stats.get(table_name, {"rows": 0})["rows"]
+               for dimension in task_key_maps.get(target_table, []) for table_name in task_inputs[dimension])
+    return rows * KEY_MAP_ROW_BYTES
+
+
+def _workers(memories: list, workers: int, budget: float) -> int:
+    # most workers (up to `workers`) whose largest jobs fit in the budget together
+    memories = sorted(memories, reverse=True)
+    workers = max(1, min(workers, len(memories)))
+    while workers > 1 and sum(memories[:workers]) > budget:
+        workers -= 1
+    return workers
+
+
+def _staging_plan(tables: list, stats: dict, share: float) -> dict:
+    # a table is extracted whole when it fits in its worker's `share` of the budget, else streamed in chunks
+    staging_plan = {}
+    for table_name in tables:
+        table = stats.get(table_name, {"rows": 0, "bytes": 0})
+        memory = _memory(table)
+        if memory > share or table_name in extract['stream_tables']:
+            # tables streamed by STREAM_TABLES keep EXTRACT_CHUNKSIZE unless they don't fit
+            chunksize = _chunksize(table, share / 2) if memory > share else extract['chunksize']
+            row_bytes = memory / table["rows"] if table["rows"] else DEFAULT_ROW_BYTES
+            staging_plan[table_name] = {"rows": table["rows"], "memory_mb": min(memory, chunksize * row_bytes) / 2**20,
+                                        "path": "stream", "chunksize": chunksize}
+        else:
+            staging_plan[table_name] = {"rows": table["rows"], "memory_mb": memory / 2**20, "path": "memory"}
+    return staging_plan
+
+
+def make_plan(tables: list, targets: list = None, stats: dict = None, budget_mb: float = None) -> dict:
+    """
+    this function plans a run of the staging `tables` and of the warehouse `targets` (every task by default).
+    The cost of each stage is its rows and its estimated peak memory (table size x PLANNER_MEMORY_FACTOR).
+    A staging table bigger than its worker's share of the budget is streamed in chunks that use half of the share,
+    fct_order uses the streaming join and fct_inventory is loaded in chunks when they need more than half of the budget
+    in memory, and the workers of each phase are the most (up to STAGING_WORKERS/WAREHOUSE_WORKERS) whose largest
+    stages fit in the budget. Stages that don't fit in the budget even alone are listed in "over_budget".
+    """
+    targets = list(task_inputs) if targets is None else targets
+    if stats is None:
+        # the warehouse tasks read the staging copy of the source tables
+        # and the dimensions of their key maps
+        dimensions = [dimension for target in targets for dimension in task_key_maps.get(target, [])]
+        stats = table_stats(source, set(tables).union(*(task_inputs[target] for target in targets + dimensions)))
+    budget = (budget_mb or planner['memory_budget_mb']) * 2**20
+    empty = {"rows": 0, "bytes": 0}
+
+    # staging: fewer workers when the largest stages don't fit in the budget even streamed (chunks have MIN_CHUNKSIZE rows)
+    staging_workers = max(1, min(parallel['staging_workers'], len(tables)))
+    while True:
+        staging_plan = _staging_plan(tables, stats, budget / staging_workers)
+        memories = [stage["memory_mb"] * 2**20 for stage in staging_plan.values()]
+        if staging_workers == 1 or _workers(memories, staging_workers, budget) == staging_workers:
+            break
+        staging_workers -= 1
+
+    # hand-off keeps the frames of the in-memory tables until the warehouse phase: only when half of the budget holds them
+    held = sum(stage["memory_mb"] for stage in staging_plan.values() if stage["path"] == "memory") * 2**20
+    keep_frames = handoff['enabled'] and held <= budget / 2
+
+    # warehouse: a task holds its input and its output frame
+    warehouse_plan = {}
+    for target_table in targets:
+        inputs = task_inputs[target_table]
+        rows = sum(stats.get(table_name, empty)["rows"] for table_name in inputs)
+        memory = 2 * sum(_memory(stats.get(table_name, empty)) for table_name in inputs)
+        warehouse_plan[target_table] = {"rows": rows, "memory_mb": memory / 2**20, "path": "memory"}
+
+    # a fact transform also holds its key maps
+    for target_table, stage in warehouse_plan.items():
+        stage["memory_mb"] += _key_maps(target_table, stats) / 2**20
+
+    order = warehouse_plan.get("fct_order")
+    if order and order_pushdown_enabled():
+        order.update(path="pushdown", memory_mb=0)
+    elif order and order["memory_mb"] * 2**20 > budget / 2:
+        # streaming join: the orders stay in memory with one chunk of order_details
+        orders = 2 * _memory(stats.get("orders", empty)) + _key_maps("fct_order", stats)
+        details = stats.get("order_details", empty)
+        chunksize = _chunksize(details, max(budget / 2 - orders, 0) / 2)
+        order.update(path="stream", chunksize=chunksize,
+                     memory_mb=(orders + 2 * min(chunksize, details["rows"]) * _memory(details) / max(details["rows"], 1)) / 2**20)
+
+    inventory = warehouse_plan.get("fct_inventory")
+    if inventory and inventory["memory_mb"] * 2**20 > budget / 2:
+        # chunked load: one chunk of inventory_tracking and its output at a time
+        key_maps = _key_maps("fct_inventory", stats)
+        tracking = stats.get("inventory_tracking", empty)
+        chunksize = _chunksize(tracking, max(budget / 2 - key_maps, 0) / 2)
+        inventory.update(path="stream", chunksize=chunksize,
+                         memory_mb=(key_maps + 2 * min(chunksize, tracking["rows"]) * _memory(tracking) / max(tracking["rows"], 1)) / 2**20)
+
+    warehouse_workers = _workers([stage["memory_mb"] * 2**20 for stage in warehouse_plan.values()],
+                                 parallel['warehouse_workers'], budget)
+
+    # fact transforms in a process pool: the parent holds the task, its partitions and the returned outputs
+    # (about the task again) and every process gets its own copy of the key maps
+    facts = {target_table: stage for target_table, stage in warehouse_plan.items()
+             if stage["path"] == "memory" and stage["rows"] >= parallel['transform_min_rows']}
+    processes = 1
+    if facts:
+        largest = max(facts.values(), key=lambda stage: stage["rows"])
+        processes = max(1, min(os.cpu_count() or 1, largest["rows"] // parallel['transform_min_rows']))
+        while processes > 1 and any(2 * stage["memory_mb"] * 2**20 + processes * _key_maps(target_table, stats)
+                                    > budget / warehouse_workers for target_table, stage in facts.items()):
+            processes -= 1
+        for stage in facts.values():
+            stage["processes"] = processes
+
+    # stages that need more than the budget even with one worker (the smallest chunks still too big)
+    over_budget = [name for name, stage in {**staging_plan, **warehouse_plan}.items() if stage["memory_mb"] * 2**20 > budget]
+
+    return {
+        "budget_mb": budget / 2**20,
+        "staging_workers": staging_workers,
+        "handoff": keep_frames,
+        "staging": staging_plan,
+        "warehouse_workers": warehouse_workers,
+        "transform_processes": processes,
+        "warehouse": warehouse_plan,
+        "over_budget": over_budget,
+    }
+
+
+def apply_plan(plan: dict) -> list:
+    """
+    this function sets the plan in the run configuration (workers, streamed tables and chunk sizes, hand-off,
+    streaming join, chunked facts and transform processes), as if they were set in the environment.
+    It returns the previous configuration, to put back with restore_config once the run is over.
+    """
+    saved = [copy.deepcopy(config) for config in _planned]
+    parallel['staging_workers'] = plan['staging_workers']
+    parallel['warehouse_workers'] = plan['warehouse_workers']
+    parallel['transform_processes'] = plan['transform_processes']
+    handoff['enabled'] = plan['handoff']
+
+    for table_name, stage in plan['staging'].items():
+        if stage['path'] == 'stream' and table_name not in extract['stream_tables']:
+            extract['stream_tables'].append(table_name)
+            extract['table_chunksize'][table_name] = stage['chunksize']
+
+    order = plan['warehouse'].get('fct_order')
+    if order and order['path'] == 'stream':
+        stream_join['enabled'] = True
+        stream_join['chunksize'] = order['chunksize']
+
+    inventory = plan['warehouse'].get('fct_inventory')
+    if inventory and inventory['path'] == 'stream':
+        if 'fct_inventory' not in fact_stream['targets']:
+            fact_stream['targets'].append('fct_inventory')
+        fact_stream['chunksize'] = inventory['chunksize']
+    return saved
+
+
+def restore_config(saved: list):
+    # put back the configuration changed by apply_plan, the dicts are shared with the modules that read them
+    for config, values in zip(_planned, saved):
+        config.clear()
+        config.update(values)
+
+
+def explain(plan: dict):
+    # print the plan, one line per stage
+    over = " (OVER BUDGET)"
+    print(f"[plan] memory budget {plan['budget_mb']:.1f} MiB")
+    print(f"[plan] staging: {plan['staging_workers']} workers, hand-off {'on' if plan['handoff'] else 'off'}")
+    for table_name, stage in plan['staging'].items():
+        print(f"[plan]   {table_name:<20} {stage['rows']:>12} rows {stage['memory_mb']:>10.1f} MiB  {stage['path']}"
+              + (f" ({stage['chunksize']} rows per chunk)" if 'chunksize' in stage else "")
+              + (over if table_name in plan['over_budget'] else ""))
+    print(f"[plan] warehouse: {plan['warehouse_workers']} workers, {plan['transform_processes']} transform processes")
+    for target_table, stage in plan['warehouse'].items():
+        print(f"[plan]   {target_table:<20} {stage['rows']:>12} rows {stage['memory_mb']:>10.1f} MiB  {stage['path']}"
+              + (f" ({stage['chunksize']} rows per chunk)" if 'chunksize' in stage else "")
+              + (f" ({stage['processes']} processes)" if stage.get('processes', 1) > 1 else "")
+              + (over if target_table in plan['over_budget'] else ""))
+    if plan['over_budget']:
+        print(f"[plan] warning: over the memory budget of {plan['budget_mb']:.1f} MiB even alone: {', '.join(plan['over_budget'])}")
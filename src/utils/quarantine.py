@@ -0,0 +1,132 @@
+
+import atexit
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime
+
+import pandas as pd
+
+from src.utils.config import minio, quarantine
+
+# Quarantine writer: failed frames are queued and written by a background worker as compressed parquet
+# (gzip csv when the frame can't be converted to arrow), under <table>/dt=<date>/ keys, to Minio or a local directory.
+PART_SIZE = 16 * 2**20
+
+_queue = queue.Queue()
+_worker = {"thread": None}
+_client = {"client": None, "buckets": set()}
+_lock = threading.Lock()
+
+
+def quarantine_key(table_name: str, extension: str, now: datetime = None):
+    now = now or datetime.now()
+    return f"{table_name}/dt={now.strftime('%Y-%m-%d')}/{table_name}_{now.strftime('%H%M%S')}_{uuid.uuid4().hex[:8]}.{extension}"
+
+
+def _serialize(data: pd.DataFrame, file):
+    # returns the file extension
+    # imported here: only a failed frame needs it
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    try:
+        pq.write_table(pa.Table.from_pandas(data), file, compression=quarantine['compression'])
+        return "parquet"
+    except (pa.ArrowException, TypeError, ValueError):
+        # mixed types in a column: keep the rows as text
+        file.seek(0)
+        file.truncate()
+        data.to_csv(file, compression={"method": "gzip"}, mode="wb")
+        return "csv.gz"
+
+
+def _minio_client():
+    with _lock:
+        if _client["client"] is None:
+            # imported here: only the minio backend needs it
+            from minio import Minio
+            _client["client"] = Minio(minio['endpoint'],
+                                      access_key=minio['access_key'],
+                                      secret_key=minio['secret_key'],
+                                      secure=minio['secure'])
+        return _client["client"]
+
+
+def _write_minio(file, size: int, bucket_name: str, key: str):
+    client = _minio_client()
+    # check the bucket once per process
+    if bucket_name not in _client["buckets"]:
+        if not client.bucket_exists(bucket_name):
+            client.make_bucket(bucket_name)
+        _client["buckets"].add(bucket_name)
+    # multipart upload streamed from the spooled file
+    client.put_object(bucket_name=bucket_name, object_name=key, data=file, length=size,
+                      part_size=PART_SIZE, content_type="application/octet-stream")
+    return f"s3://{bucket_name}/{key}"
+
+
+def _write_local(file, bucket_name: str, key: str):
+    path = os.path.join(quarantine['local_dir'], bucket_name, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as target:
+        shutil.copyfileobj(file, target)
+    return path
+
+
+def write_quarantine(data: pd.DataFrame, table_name: str, bucket_name: str, now: datetime = None):
+    """
+    this function writes a frame to the quarantine backend (QUARANTINE_BACKEND: minio or local) and returns where.
+    When Minio is unreachable the frame is written to the local directory instead.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=PART_SIZE) as file:
+        extension = _serialize(data, file)
+        size = file.tell()
+        key = quarantine_key(table_name, extension, now)
+        file.seek(0)
+        if quarantine['backend'] == "minio":
+            try:
+                return _write_minio(file, size, bucket_name, key)
+            except Exception as e:
+                print(f"quarantine upload of {table_name} failed, written locally. Cause: {e}")
+                file.seek(0)
+        return _write_local(file, bucket_name, key)
+
+
+def _work():
+    while True:
+        data, table_name, bucket_name, now = _queue.get()
+        try:
+            print(f"[quarantine] {table_name}: {write_quarantine(data, table_name, bucket_name, now)}")
+        except Exception as e:
+            print(f"Can't quarantine {table_name}. Cause: ", str(e))
+        finally:
+            _queue.task_done()
+
+
+def quarantine_frame(data: pd.DataFrame, table_name: str, bucket_name: str):
+    """
+    this function queues a frame for the quarantine and returns at once, the background worker writes it.
+    The frame must not be changed by the caller afterwards.
+    """
+    if data is None:
+        return
+    with _lock:
+        if _worker["thread"] is None:
+            _worker["thread"] = threading.Thread(target=_work, name="quarantine", daemon=True)
+            _worker["thread"].start()
+    _queue.put((data, table_name, bucket_name, datetime.now()))
+
+
+def flush_quarantine():
+    """
+    this function waits until every queued frame is written.
+    """
+    if _worker["thread"] is not None:
+        _queue.join()
+
+
+# frames still queued when the process exits
+atexit.register(flush_quarantine)
@@ -0,0 +1,100 @@
+
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from src.utils.engine import get_engine
+from src.utils.helper import etl_log, upsert_dataframe
+from src.utils.config import change_detection
+
+# Change detection: a 64 bit hash of the business columns of each row is stored per table and key
+# in the etl_row_hash table of the database the rows are written to. Rows whose hash didn't change are not written again.
+EXCLUDED_COLUMNS = ("created_at",)
+
+_created = set()
+_lock = threading.Lock()
+
+
+def _normalize(series: pd.Series) -> pd.Series:
+    # same value, same hash whatever the dtype plan made of the column (int8/int64/Int64, category/object, ns/us)
+    if pd.api.types.is_bool_dtype(series) or (pd.api.types.is_numeric_dtype(series)
+                                             and not isinstance(series.dtype, pd.CategoricalDtype)):
+        return pd.Series(series.to_numpy(dtype="float64", na_value=np.nan), index=series.index)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, "tz", None) is not None:
+            series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+        return series.astype("datetime64[ns]")
+    return series.astype(str)
+
+
+def _hash(data: pd.DataFrame, columns: list) -> np.ndarray:
+    normalized = pd.DataFrame({column: _normalize(data[column]) for column in columns}, index=data.index)
+    # bigint column in postgres
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy().view("int64")
+
+
+def row_hashes(data: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """
+    this function returns the key hash and the row hash (business columns, without created_at) of every row of data.
+    """
+    columns = sorted(column for column in data.columns if column not in EXCLUDED_COLUMNS)
+    return pd.DataFrame({"key_hash": _hash(data, keys), "row_hash": _hash(data, columns)}, index=data.index)
+
+
+def _ensure_table(db: dict):
+    key = (db['host'], db['port'], db['db'])
+    with _lock:
+        if key in _created:
+            return
+        with get_engine(db).begin() as conn:
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {change_detection['table']} (
+                    table_name TEXT NOT NULL,
+                    key_hash BIGINT NOT NULL,
+                    row_hash BIGINT NOT NULL,
+                    PRIMARY KEY (table_name, key_hash)
+                )
+            """))
+        _created.add(key)
+
+
+def changed_rows(db: dict, step: str, table_name: str, data: pd.DataFrame, keys: list):
+    """
+    this function keeps the rows of data that are new or changed since their hash was committed to db.
+    Only the hashes of the keys of data are read, so a streamed table costs one indexed lookup per chunk. It returns the changed rows and their hashes, to commit with commit_row_hashes() once they are written.
+    """
+    _ensure_table(db)
+    hashes = row_hashes(data, keys)
+    # only the stored hashes of the keys in data (one chunk of a streamed table), through the primary key index
+    stored = pd.read_sql(text(f"SELECT key_hash, row_hash FROM {change_detection['table']} "
+                              "WHERE table_name = :table_name AND key_hash = ANY(:keys)"),
+                         con=get_engine(db), params={"table_name": table_name,
+                                                     "keys": hashes["key_hash"].unique().tolist()})
+    # Int64 so the 64 bit hashes aren't rounded through float by the missing (new) keys
+    previous = hashes["key_hash"].map(stored.set_index("key_hash")["row_hash"].astype("Int64"))
+    changed = (previous.isna() | (previous != hashes["row_hash"])).astype(bool)
+
+    etl_log({
+        "step" : step,
+        "component": "change detection",
+        "status": "success",
+        "table_name": table_name,
+        "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+        "rows": len(data),
+        "rows_changed": int(changed.sum())
+    })
+    return data[changed], hashes[changed]
+
+
+def commit_row_hashes(db: dict, table_name: str, hashes: pd.DataFrame):
+    """
+    this function stores the hashes of rows written to table_name, after the write succeeded.
+    """
+    if hashes.empty:
+        return
+    with get_engine(db).begin() as conn:
+        upsert_dataframe(conn, hashes.assign(table_name=table_name), table_name=change_detection['table'],
+                         pk=["table_name", "key_hash"])
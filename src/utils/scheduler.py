@@ -0,0 +1,149 @@
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+import time
+
+from src.utils.helper import etl_log
+
+
+def check_dag(tasks: dict):
+    """
+    this function checks that every dependency is a declared task and that the graph has no cycle,
+    and returns the task names in topological order.
+    """
+    for name, task in tasks.items():
+        for dep in task['deps']:
+            if dep not in tasks:
+                raise ValueError(f"task {name} depends on unknown task {dep}")
+
+    order = []
+    visiting = set()
+    done = set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"dependency cycle at task {name}")
+        visiting.add(name)
+        for dep in tasks[name]['deps']:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in tasks:
+        visit(name)
+    return order
+
+
+def subgraph(tasks: dict, names: list):
+    """
+    this function returns the tasks in `names` with their dependencies outside the selection removed,
+    for rerunning part of the graph when the other tasks are already loaded.
+    """
+    return {name: dict(tasks[name], deps=[dep for dep in tasks[name]['deps'] if dep in names]) for name in names}
+
+
+def downstream(tasks: dict, name: str):
+    # every task that depends (directly or not) on `name`
+    result = set()
+    stack = [name]
+    while stack:
+        current = stack.pop()
+        for other, task in tasks.items():
+            if current in task['deps'] and other not in result:
+                result.add(other)
+                stack.append(other)
+    return result
+
+
+def critical_path(tasks: dict, results: dict, order: list):
+    """
+    this function returns the chain of tasks with the longest total duration (the run can't be faster than it).
+    """
+    finish = {}
+    previous = {}
+    for name in order:
+        duration = results[name]['duration'] or 0
+        deps = [dep for dep in tasks[name]['deps'] if dep in finish]
+        slowest = max(deps, key=lambda dep: finish[dep], default=None)
+        finish[name] = duration + (finish[slowest] if slowest else 0)
+        previous[name] = slowest
+
+    if not finish:
+        return []
+    path = [max(finish, key=finish.get)]
+    while previous[path[-1]]:
+        path.append(previous[path[-1]])
+    return path[::-1]
+
+
+def run_dag(tasks: dict, workers: int = 4, step: str = "warehouse"):
+    """
+    this function runs a task graph {name: {"func": callable, "deps": [names]}}.
+    A task starts as soon as all its dependencies succeeded, up to `workers` tasks at a time.
+    A task fails when its function raises or returns a falsy value; its downstream tasks are skipped.
+    """
+    order = check_dag(tasks)
+    results = {name: {"status": "pending", "duration": None} for name in tasks}
+
+    start = time.perf_counter()
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            # submit every task whose dependencies are done
+            for name in order:
+                task = tasks[name]
+                if results[name]['status'] == 'pending' and all(results[dep]['status'] == 'success' for dep in task['deps']):
+                    results[name]['status'] = 'running'
+                    results[name]['start'] = time.perf_counter()
+                    running[executor.submit(task['func'])] = name
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                results[name]['duration'] = time.perf_counter() - results[name]['start']
+                try:
+                    ok = future.result()
+                    error = None
+                except Exception as e:
+                    ok = False
+                    error = str(e)
+                results[name]['status'] = 'success' if ok else 'failed'
+
+                if not ok:
+                    if error:
+                        etl_log({
+                            "step" : step,
+                            "component": "scheduler",
+                            "status": "failed",
+                            "table_name": name,
+                            "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                            "error_msg": error
+                        })
+                    for skipped in downstream(tasks, name):
+                        if results[skipped]['status'] == 'pending':
+                            results[skipped]['status'] = 'skipped'
+                            etl_log({
+                                "step" : step,
+                                "component": "scheduler",
+                                "status": "skipped",
+                                "table_name": skipped,
+                                "etl_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current timestamp
+                                "error_msg": f"upstream task {name} failed"
+                            })
+    wall_time = time.perf_counter() - start
+
+    # summary with the critical path of this run
+    for name in order:
+        duration = results[name]['duration']
+        print(f"[{step}] {name}: {results[name]['status']}" + (f" in {duration:.2f}s" if duration is not None else ""))
+    path = critical_path(tasks, results, order)
+    print(f"[{step}] critical path: " + " -> ".join(f"{name} ({results[name]['duration'] or 0:.2f}s)" for name in path))
+    print(f"[{step}] wall time {wall_time:.2f}s with {workers} workers")
+
+    return results
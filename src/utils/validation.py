@@ -0,0 +1,106 @@
+
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from src.utils.coerce import to_currency
+from src.utils.helper import etl_log
+from src.utils.quarantine import quarantine_frame
+from src.utils.config import validation
+
+# Validation rules of the staging tables (README, Data Validation):
+# every column must have a value, "date" columns a valid date,
+# "numeric"/"currency" columns a valid number, "non_negative" columns a number >= 0 and "not_blank" columns
+# more than whitespace (an empty spreadsheet cell is read as '', not as a missing value).
+validation_rules = {
+    "customers": {"numeric": ["loyalty_points"], "non_negative": ["loyalty_points"]},
+    "employees": {"date": ["hire_date"]},
+    "products": {"currency": ["unit_price", "cost_price"], "non_negative": ["unit_price", "cost_price"]},
+    "orders": {"date": ["order_date"], "numeric": ["total_amount"], "non_negative": ["total_amount"]},
+    "order_details": {"numeric": ["unit_price", "quantity", "subtotal"], "non_negative": ["unit_price", "quantity", "subtotal"]},
+    "inventory_tracking": {"date": ["change_date"], "numeric": ["quantity_change"], "non_negative": ["quantity_change"]},
+    "store_branch": {"numeric": ["store_id"], "non_negative": ["store_id"], "not_blank": ["store_name", "city"]},
+}
+
+# created_at is set by the pipeline, not by the source
+NOT_VALIDATED = ("created_at",)
+
+
+def rule_masks(data: pd.DataFrame, table_name: str) -> dict:
+    """
+    this function evaluates every rule of a table on data and returns {rule name: boolean mask of the violating rows}.
+    """
+    rules = {kind: [column for column in columns if column in data.columns]
+             for kind, columns in validation_rules.get(table_name, {}).items()}
+    masks = {}
+
+    for column in data.columns:
+        if column not in NOT_VALIDATED:
+            masks[f"missing_value:{column}"] = data[column].isna()
+
+    numbers = {}
+    for column in rules.get("numeric", []):
+        numbers[column] = pd.to_numeric(data[column], errors="coerce")
+    for column in rules.get("currency", []):
+        numbers[column] = to_currency(data[column], signed=True)
+    for column, number in numbers.items():
+        masks[f"numeric:{column}"] = number.isna() & data[column].notna()
+
+    for column in rules.get("date", []):
+        dates = data[column] if pd.api.types.is_datetime64_any_dtype(data[column]) else pd.to_datetime(data[column], errors="coerce")
+        masks[f"date:{column}"] = dates.isna() & data[column].notna()
+
+    for column in rules.get("non_negative", []):
+        number = numbers[column] if column in numbers else pd.to_numeric(data[column], errors="coerce")
+        masks[f"non_negative:{column}"] = (number < 0).fillna(False)
+
+    for column in rules.get("not_blank", []):
+        masks[f"not_blank:{column}"] = data[column].astype("string").str.strip().eq("").fillna(False)
+
+    return {rule: mask.to_numpy(dtype=bool) for rule, mask in masks.items()}
+
+
+def validate(data: pd.DataFrame, table_name: str, step: str = "warehouse") -> pd.DataFrame:
+    """
+    this function checks data against the rules of the table in one pass. The violating rows are quarantined
+    with the rules they broke, the violation count of each rule is logged, and the valid rows are returned.
+    """
+    if not validation['enabled'] or data is None or data.empty or table_name not in validation_rules:
+        return data
+
+    masks = rule_masks(data, table_name)
+    invalid = np.logical_or.reduce(list(masks.values())) if masks else np.zeros(len(data), dtype=bool)
+    etl_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    for rule, mask in masks.items():
+        count = int(mask.sum())
+        if count:
+            etl_log({
+                "step" : step,
+                "component": "validation",
+                "status": "failed",
+                "table_name": table_name,
+                "etl_date": etl_date,
+                "rule": rule,
+                "rows": count
+            })
+    etl_log({
+        "step" : step,
+        "component": "validation",
+        "status": "success",
+        "table_name": table_name,
+        "etl_date": etl_date,
+        "rows": len(data),
+        "rows_invalid": int(invalid.sum())
+    })
+
+    if invalid.any():
+        rejected = data[invalid].copy()
+        # rules broken by each rejected row, e.g. "missing_value:phone;non_negative:loyalty_points"
+        violations = np.full(len(rejected), "", dtype=object)
+        for rule, mask in masks.items():
+            violations = violations + np.where(mask[invalid], f"{rule};", "")
+        rejected["violations"] = pd.Series(violations, index=rejected.index).str.rstrip(";")
+        quarantine_frame(rejected, table_name=f"{table_name}_invalid", bucket_name=validation['bucket'])
+    return data[~invalid]
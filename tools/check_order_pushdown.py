@@ -0,0 +1,44 @@
+
+import sys
+
+import pandas as pd
+
+from src.integration.warehouse.extract import extract_staging
+from src.integration.warehouse.transform import transform_order, transform_order_pushdown
+
+# Parity check: the pushdown transform must give the same fact rows as the pandas transform.
+# Usage: python -m tools.check_order_pushdown
+
+
+def normalize(data: pd.DataFrame) -> pd.DataFrame:
+    # created_at is the run timestamp, row order and column order are not part of the contract
+    data = data.drop(columns=['created_at'])
+    # so are the dtypes: the pandas path has the categoricals of the dtype plans, the pushdown path plain strings
+    data = data.astype({column: object for column in data.select_dtypes(include=['category', 'string']).columns})
+    data = data[sorted(data.columns)]
+    return data.sort_values('nk_order_id').reset_index(drop=True)
+
+
+def check_order_pushdown():
+    pandas_path = transform_order(data=extract_staging(table_name='orders'), table_name='orders')
+    try:
+        chunks = list(transform_order_pushdown(table_name='orders'))
+    except Exception:
+        chunks = None
+    if pandas_path is None or chunks is None:
+        print("a transform failed, see etl_log")
+        return False
+    pushdown_path = pd.concat(chunks, ignore_index=True) if chunks else pandas_path.iloc[:0]
+
+    try:
+        pd.testing.assert_frame_equal(normalize(pandas_path), normalize(pushdown_path), check_dtype=False)
+    except AssertionError as e:
+        print(f"pandas and pushdown outputs differ:\n{e}")
+        return False
+
+    print(f"pandas and pushdown outputs match ({len(pandas_path)} rows)")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_order_pushdown() else 1)
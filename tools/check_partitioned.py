@@ -0,0 +1,41 @@
+import sys
+
+import pandas as pd
+
+from src.integration.warehouse.extract import extract_staging
+from src.integration.warehouse.keymap import get_key_map
+from src.integration.warehouse.transform import order_rows, inventory_rows
+from src.utils.parallel import run_partitioned
+from src.utils.helper import flush_etl_log
+
+# Parity check: the fact transforms must give the same rows, in the same order, in a process pool as in one process.
+# Usage: python -m tools.check_partitioned [processes]
+
+
+def check_partitioned(processes: int = 4):
+    details = extract_staging(table_name='order_details').sort_values('order_detail_id', kind='stable')
+    details = details.drop(columns=['created_at', 'order_detail_id'])
+    cases = [
+        (order_rows, extract_staging(table_name='orders'), 'order_id',
+         {"partitioned": {"details": (details, 'order_id')}, "employee_map": get_key_map('dim_employees'),
+          "customer_map": get_key_map('dim_customers'), "product_map": get_key_map('dim_products')}),
+        (inventory_rows, extract_staging(table_name='inventory_tracking'), 'tracking_id',
+         {"product_map": get_key_map('dim_products')}),
+    ]
+
+    same = True
+    for func, data, key, kwargs in cases:
+        single = run_partitioned(func, data.copy(), key, processes=1, **kwargs)
+        partitioned = run_partitioned(func, data.copy(), key, processes=processes, min_rows=0, **kwargs)
+        try:
+            pd.testing.assert_frame_equal(single, partitioned)
+            print(f"{func.__name__}: {len(single)} rows, same output with {processes} processes")
+        except AssertionError as e:
+            print(f"{func.__name__}: outputs differ:\n{e}")
+            same = False
+    flush_etl_log()
+    return same
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_partitioned(int(sys.argv[1]) if len(sys.argv) > 1 else 4) else 1)
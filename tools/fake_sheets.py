@@ -0,0 +1,86 @@
+import tempfile
+
+from src.utils.config import sheets
+from src.integration.staging import extract
+
+# Local fake of the gspread client, for running the spreadsheet extraction without Google credentials.
+# Usage: extract.set_sheets_client(FakeSheetsClient({"<key>": {"store_branch": [["store_id", ...], [...]]}}))
+# python -m tools.fake_sheets checks the batched and conditional fetch against it.
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheets: dict, modified_time: str = "2024-01-01T00:00:00.000Z"):
+        self.worksheets = worksheets
+        self.modified_time = modified_time
+        self.requests = []
+
+    def get_lastUpdateTime(self):
+        self.requests.append("get_lastUpdateTime")
+        return self.modified_time
+
+    def values_batch_get(self, ranges, params=None):
+        self.requests.append("values_batch_get")
+        value_ranges = []
+        for sheet_range in ranges:
+            name = sheet_range.strip("'").replace("''", "'")
+            # like the API, trailing empty cells are left out
+            values = [list(row) for row in self.worksheets[name]]
+            for row in values:
+                while row and row[-1] == '':
+                    row.pop()
+            value_ranges.append({"range": sheet_range, "majorDimension": "ROWS", "values": values})
+        return {"valueRanges": value_ranges}
+
+
+class FakeSheetsClient:
+    def __init__(self, spreadsheets: dict):
+        self.spreadsheets = {key: FakeSpreadsheet(worksheets) for key, worksheets in spreadsheets.items()}
+        self.opened = 0
+
+    def open_by_key(self, key):
+        self.opened += 1
+        return self.spreadsheets[key]
+
+
+def check_fake_sheets():
+    key = "fake-spreadsheet"
+    worksheets = {
+        "store_branch": [["store_id", "store_name", "city"], ["1", "Paccafe Kemang", "Jakarta"], ["2", "Paccafe Depok", '']],
+        "targets": [["store_id", "target"], ["1", "100"]],
+    }
+    client = FakeSheetsClient({key: worksheets})
+    spreadsheet = client.spreadsheets[key]
+    sheets.update({"worksheets": list(worksheets), "conditional": True, "snapshot_dir": tempfile.mkdtemp()})
+    extract.set_sheets_client(client)
+
+    # one batch request for both worksheets
+    first = extract.extract_sheet(key, "store_branch")
+    second = extract.extract_sheet(key, "targets")
+    assert spreadsheet.requests.count("values_batch_get") == 1, spreadsheet.requests
+    assert first.shape == (2, 3) and first.loc[1, "city"] == '' and list(second.columns) == ["store_id", "target"]
+
+    # not modified: read from the snapshot
+    again = extract.extract_sheet(key, "store_branch")
+    assert again.attrs["sheet_source"] == "snapshot" and again.equals(first)
+    assert spreadsheet.requests.count("values_batch_get") == 1 and client.opened == 1
+
+    # modified: downloaded again, also the worksheet prefetched before the change
+    spreadsheet.modified_time = "2024-02-01T00:00:00.000Z"
+    worksheets["store_branch"].append(["3", "Paccafe Bogor", "Bogor"])
+    worksheets["targets"].append(["3", "300"])
+    targets = extract.extract_sheet(key, "targets")
+    assert targets.attrs["sheet_source"] == "api" and len(targets) == 2
+    changed = extract.extract_sheet(key, "store_branch")
+    assert changed.attrs["sheet_source"] == "api" and len(changed) == 3
+    assert spreadsheet.requests.count("values_batch_get") == 2, spreadsheet.requests
+
+    # a new run doesn't read the worksheets prefetched by the previous one
+    extract.extract_sheet(key, "store_branch")
+    extract.clear_fetched()
+    assert extract.extract_sheet(key, "targets").attrs["sheet_source"] == "snapshot"
+    assert spreadsheet.requests.count("values_batch_get") == 2, spreadsheet.requests
+    print(f"fake sheets: ok, requests: {spreadsheet.requests}")
+
+
+if __name__ == "__main__":
+    check_fake_sheets()
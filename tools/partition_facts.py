@@ -0,0 +1,58 @@
+import argparse
+
+from sqlalchemy import text
+
+from src.utils.config import warehouse
+from src.utils.engine import get_engine, dispose_engines
+from src.integration.warehouse.partition import partition_keys, is_partitioned, create_partition
+
+# Converts fct_order/fct_inventory into tables range partitioned by month on their date key, keeping their rows.
+# The surrogate key primary key becomes a plain index (a primary key of a partitioned table must include
+# the partition key, which can be null). The old table is kept as <table>_unpartitioned unless --drop is given.
+# Usage: python -m tools.partition_facts [--drop] [fct_order fct_inventory]
+
+
+def partition_table(connection, table_name: str, drop: bool = False):
+    date_key, natural_key = partition_keys[table_name]
+    old = f"{table_name}_unpartitioned"
+    surrogate_key = connection.execute(text("""
+        SELECT a.attname FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+        WHERE i.indrelid = CAST(:table_name AS regclass) AND i.indisprimary
+    """), {"table_name": f"public.{table_name}"}).scalars().all()
+
+    connection.exec_driver_sql(f"ALTER TABLE public.{table_name} RENAME TO {old}")
+    connection.exec_driver_sql(f"CREATE TABLE public.{table_name} (LIKE public.{old} INCLUDING DEFAULTS) PARTITION BY RANGE ({date_key})")
+    for column in surrogate_key + [natural_key]:
+        connection.exec_driver_sql(f"CREATE INDEX ON public.{table_name} ({column})")
+    connection.exec_driver_sql(f"CREATE TABLE public.{table_name}_default PARTITION OF public.{table_name} DEFAULT")
+
+    # one partition per month present, before the rows are moved so none lands in the default partition
+    months = connection.exec_driver_sql(
+        f"SELECT DISTINCT {date_key} / 100 FROM public.{old} WHERE {date_key} IS NOT NULL ORDER BY 1").scalars().all()
+    for month in months:
+        create_partition(connection, table_name, int(month))
+    connection.exec_driver_sql(f"INSERT INTO public.{table_name} SELECT * FROM public.{old}")
+
+    if drop:
+        connection.exec_driver_sql(f"DROP TABLE public.{old}")
+    return len(months)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition the fact tables by month")
+    parser.add_argument("tables", nargs="*", default=list(partition_keys))
+    parser.add_argument("--drop", action="store_true", help="drop the old unpartitioned tables")
+    args = parser.parse_args()
+
+    with get_engine(warehouse).begin() as connection:
+        for table_name in args.tables:
+            if is_partitioned(connection, table_name):
+                print(f"{table_name} is already partitioned")
+                continue
+            print(f"{table_name}: {partition_table(connection, table_name, drop=args.drop)} monthly partitions")
+    dispose_engines()
+
+
+if __name__ == "__main__":
+    main()